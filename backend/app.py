@@ -1,13 +1,33 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from nlp import analyze_symptoms_advanced
-from db_config import get_mysql_connection
+from nlp import analyze_symptoms_advanced, analyze_symptoms_batch, refresh_symptom_index, refresh_followup_catalogue, search_history, get_cache_stats
+from db_config import mysql_connection, mysql_pool
+from doctor_lookup import (
+    fetch_doctors_for_matches, rank_doctors_by_distance, attach_slots, get_hospital_index_stats,
+    slot_cache, invalidate_doctor_slots, warm_slot_cache, SLOT_CACHE_WARM_SIZE,
+    resolve_page_size, resolve_ranking, page_doctors, encode_page_cursor, decode_page_cursor,
+    map_concurrently, resolve_doctor_fields, select_doctor_fields
+)
+from doctor_directory import get_directory_stats
+from bookings import (
+    PATIENT_EXISTS_QUERY, INSERT_PATIENT_QUERY, SLOT_DETAILS_QUERY, BOOKING_IDENTITY_FIELDS, IDEMPOTENCY_SCOPE,
+    booking_record, booking_response
+)
 from pymongo import MongoClient
 from datetime import datetime
-import math
 from prescription_routes import prescription_bp #OCR
+from serializers import FastJSONProvider, stream_json_list
+from patient_versions import APPOINTMENTS, record_patient_change, conditional_patient_response
+from compression import compress_response
+from idempotency import IDEMPOTENCY_COLLECTION, IdempotencyStore, idempotent
+from slot_reservations import (
+    SLOT_HOLD_SECONDS, HoldsUnavailable, reserve_slot, release_slot, hold_slot, confirm_hold, release_hold,
+    start_hold_sweeper
+)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
 CORS(app, resources={r"/*": {"origins": "*"}})
 # Register prescription blueprint
 app.register_blueprint(prescription_bp) #OCR
@@ -15,19 +35,31 @@ app.register_blueprint(prescription_bp) #OCR
 # MongoDB connection for appointment history
 mongo_client = MongoClient("mongodb://localhost:27017/")
 mongo_db = mongo_client["mediquery_nlp"]
+booking_requests = IdempotencyStore(mongo_db[IDEMPOTENCY_COLLECTION])
+# Created here rather than under __main__, so every WSGI server gets the TTL index
+try:
+    booking_requests.ensure_indexes()
+except Exception as e:
+    print(f"⚠️ Could not create the idempotency_keys TTL index: {e}")
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two coordinates using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
-    
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat / 2) ** 2 + 
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-         math.sin(dlon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    return R * c
+# Abandoned holds hide their slots from searches until they are reclaimed
+start_hold_sweeper(mysql_connection)
+
+MAX_BATCH_QUERIES = 50
+
+def page_cursor(disease, specialist, user_lat, user_lng, max_distance, page_size, ranking, after):
+    """Continuation token for /search/page, or None on the last page"""
+    if after is None:
+        return None
+    return encode_page_cursor({
+        "disease": disease,
+        "specialist": specialist,
+        "latitude": user_lat,
+        "longitude": user_lng,
+        "max_distance_km": max_distance,
+        "page_size": page_size,
+        "ranking": ranking
+    }, after)
 
 @app.route("/search", methods=["POST"])
 def search_disease():
@@ -36,104 +68,188 @@ def search_disease():
     user_lat = data.get("latitude")
     user_lng = data.get("longitude")
     max_distance = data.get("max_distance_km", 20)
+    page_size = resolve_page_size(data.get("page_size"))
+    ranking = resolve_ranking(data.get("ranking"))
     
     if not symptoms:
         return jsonify({"error": "No symptoms provided"}), 400
     
+    try:
+        fields = resolve_doctor_fields(data.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     disease_matches = analyze_symptoms_advanced(symptoms)
     
     if not disease_matches:
         return jsonify({"message": "No matching disease found"})
     
+    with mysql_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        near = (user_lat, user_lng, max_distance) if user_lat and user_lng else None
+        doctors_by_pair = fetch_doctors_for_matches(
+            cursor, [(match["disease"], match["specialist"]) for match in disease_matches], near, fields
+        )
+        cursor.close()
+    
+    def disease_page(match):
+        """Rank, page and load slots for one disease; runs on the fan-out pool"""
+        doctors, after = page_doctors(
+            doctors_by_pair[(match["disease"], match["specialist"])],
+            user_lat, user_lng, max_distance, page_size, ranking
+        )
+        # Slots are only loaded for the doctors that made it into the response
+        if fields is None or "available_slots" in fields:
+            attach_slots(None, doctors)
+        return select_doctor_fields(doctors, fields), after
+    
     results = []
     
-    for match in disease_matches:
-        disease_name = match["disease"]
-        specialist_needed = match["specialist"]
-        
-        conn = get_mysql_connection()
+    for match, (doctors, after) in zip(disease_matches, map_concurrently(disease_page, disease_matches)):
+        results.append({
+            "disease": match["disease"],
+            "confidence": match["confidence"],
+            "matched_symptoms": match["matched_symptoms"],
+            "requires_urgent_care": match["requires_urgent_care"],
+            "follow_up_questions": match.get("follow_up_questions", []),
+            "doctors": doctors,
+            "next_cursor": page_cursor(
+                match["disease"], match["specialist"], user_lat, user_lng,
+                max_distance, page_size, ranking, after
+            )
+        })
+    
+    return jsonify({"matches": results})
+
+@app.route("/search/page", methods=["POST"])
+def search_page():
+    """
+    Next page of doctors for one disease from a /search next_cursor. Only
+    doctors ranked after the cursor are selected, and slots are loaded
+    for that page alone.
+    """
+    data = request.get_json()
+    token = data.get("cursor")
+    
+    if not token:
+        return jsonify({"error": "No cursor provided"}), 400
+    
+    try:
+        state, after = decode_page_cursor(token)
+        disease_name, specialist_needed = state["disease"], state["specialist"]
+        user_lat, user_lng = [
+            float(state[key]) if state[key] is not None else None for key in ("latitude", "longitude")
+        ]
+        max_distance = float(state["max_distance_km"])
+        page_size = resolve_page_size(state["page_size"])
+        ranking = resolve_ranking(state["ranking"])
+    except (ValueError, KeyError, TypeError):
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    try:
+        fields = resolve_doctor_fields(data.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    with mysql_connection() as conn:
         cursor = conn.cursor(dictionary=True)
+        near = (user_lat, user_lng, max_distance) if user_lat and user_lng else None
+        doctors_by_pair = fetch_doctors_for_matches(
+            cursor, [(disease_name, specialist_needed)], near, fields, page=(ranking, after, page_size + 1)
+        )
         
-        query = """
-        SELECT 
-            d.doctor_id,
-            d.name AS doctor_name,
-            d.specialization,
-            d.contact_no,
-            h.name AS hospital_name,
-            h.location,
-            h.latitude,
-            h.longitude,
-            h.rating AS hospital_rating,
-            COALESCE(dde.success_rate, 0) AS success_rate,
-            COALESCE(dde.total_cases, 0) AS total_cases,
-            cf.base_fee
-        FROM doctor d
-        JOIN hospital h ON d.hospital_id = h.hospital_id
-        JOIN disease di ON di.name = %s
-        LEFT JOIN doctor_disease_expertise dde 
-            ON d.doctor_id = dde.doctor_id AND di.disease_id = dde.disease_id
-        LEFT JOIN consultation_fees cf 
-            ON d.doctor_id = cf.doctor_id AND cf.consultation_type = 'in-person'
-        WHERE d.specialization = %s
-        """
-        
-        cursor.execute(query, (disease_name, specialist_needed))
-        doctors = cursor.fetchall()
-        
-        doctors_with_distance = []
-        for doc in doctors:
-            if user_lat and user_lng:
-                distance = calculate_distance(
-                    user_lat, user_lng,
-                    float(doc["latitude"]), float(doc["longitude"])
-                )
-                
-                if distance <= max_distance:
-                    doc["distance_km"] = round(distance, 2)
-                    doctors_with_distance.append(doc)
-            else:
-                doctors_with_distance.append(doc)
+        doctors, next_after = page_doctors(
+            doctors_by_pair[(disease_name, specialist_needed)],
+            user_lat, user_lng, max_distance, page_size, ranking, after
+        )
+        if fields is None or "available_slots" in fields:
+            attach_slots(cursor, doctors)
         
-        doctors_with_distance.sort(
-            key=lambda x: (x.get("distance_km", 999), -x.get("success_rate", 0))
+        cursor.close()
+    
+    return jsonify({
+        "disease": disease_name,
+        "doctors": select_doctor_fields(doctors, fields),
+        "next_cursor": page_cursor(
+            disease_name, specialist_needed, user_lat, user_lng,
+            max_distance, page_size, ranking, next_after
         )
+    })
+
+@app.route("/search/batch", methods=["POST"])
+def search_batch():
+    """
+    Analyze many symptom queries in one request.
+    Doctor lookups are shared between queries that resolve to the same
+    disease + specialist, and slots are fetched once per doctor.
+    """
+    data = request.get_json()
+    queries = data.get("queries")
+    
+    if not queries or not isinstance(queries, list):
+        return jsonify({"error": "No queries provided"}), 400
+    
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+    
+    valid = [i for i, q in enumerate(queries) if isinstance(q, dict) and q.get("symptoms")]
+    batch_matches = analyze_symptoms_batch([queries[i]["symptoms"] for i in valid])
+    matches_by_query = dict(zip(valid, batch_matches))
+    
+    results = []
+    
+    with mysql_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        doctors_by_pair = fetch_doctors_for_matches(cursor, [
+            (match["disease"], match["specialist"])
+            for disease_matches in batch_matches
+            for match in disease_matches
+        ])
         
-        for doc in doctors_with_distance:
-            cursor.execute("""
-                SELECT slot_id, slot_date, slot_time 
-                FROM appointment_slots 
-                WHERE doctor_id = %s AND is_booked = FALSE 
-                AND slot_date >= CURDATE()
-                ORDER BY slot_date, slot_time 
-                LIMIT 5
-            """, (doc["doctor_id"],))
+        for i, query in enumerate(queries):
+            if i not in matches_by_query:
+                results.append({"error": "No symptoms provided"})
+                continue
             
-            slots = cursor.fetchall()
-
-            formatted_slots = []
-            for slot in slots:
-                formatted_slots.append({
-                    "slot_id": slot["slot_id"],
-                    "slot_date": slot["slot_date"].isoformat(),
-                    "slot_time": str(slot["slot_time"])
+            disease_matches = matches_by_query[i]
+            if not disease_matches:
+                results.append({"message": "No matching disease found"})
+                continue
+            
+            query_results = []
+            for match in disease_matches:
+                key = (match["disease"], match["specialist"])
+                
+                # Copy the shared rows since distance_km depends on the query
+                doctors = rank_doctors_by_distance(
+                    [dict(doc) for doc in doctors_by_pair[key]],
+                    query.get("latitude"), query.get("longitude"),
+                    query.get("max_distance_km", 20),
+                    limit=resolve_page_size(query.get("page_size")),
+                    ranking=resolve_ranking(query.get("ranking"))
+                )
+                
+                query_results.append({
+                    "disease": match["disease"],
+                    "confidence": match["confidence"],
+                    "matched_symptoms": match["matched_symptoms"],
+                    "requires_urgent_care": match["requires_urgent_care"],
+                    "follow_up_questions": match.get("follow_up_questions", []),
+                    "doctors": doctors
                 })
-
-            doc["available_slots"] = formatted_slots
+            
+            results.append({"matches": query_results})
         
-        cursor.close()
-        conn.close()
+        attach_slots(cursor, [
+            doc
+            for result in results
+            for match in result.get("matches", [])
+            for doc in match["doctors"]
+        ])
         
-        results.append({
-            "disease": disease_name,
-            "confidence": match["confidence"],
-            "matched_symptoms": match["matched_symptoms"],
-            "requires_urgent_care": match["requires_urgent_care"],
-            "follow_up_questions": match.get("follow_up_questions", []),
-            "doctors": doctors_with_distance[:10]
-        })
+        cursor.close()
     
-    return jsonify({"matches": results})
+    return jsonify({"results": results})
 
 @app.route("/submit-followup", methods=["POST"])
 def submit_followup():
@@ -141,6 +257,11 @@ def submit_followup():
     data = request.get_json()
     original_symptoms = data.get("original_symptoms")
     follow_up_answers = data.get("follow_up_answers")
+    user_lat = data.get("latitude")
+    user_lng = data.get("longitude")
+    max_distance = data.get("max_distance_km", 20)
+    page_size = resolve_page_size(data.get("page_size"))
+    ranking = resolve_ranking(data.get("ranking"))
     
     print(f"\n{'='*60}")
     print(f"RECEIVED FOLLOW-UP ANSWERS")
@@ -151,71 +272,30 @@ def submit_followup():
     if not original_symptoms or not follow_up_answers:
         return jsonify({"error": "Missing symptoms or answers"}), 400
     
-    # Re-analyze with follow-up data
-    refined_matches = analyze_symptoms_advanced(original_symptoms, follow_up_answers)
+    # Re-analyze with follow-up data (the refined record below is the only history entry)
+    refined_matches = analyze_symptoms_advanced(original_symptoms, follow_up_answers, log_history=False)
     
     print(f"\n{'='*60}")
     print(f"✅ REFINED RESULTS: {len(refined_matches)} matches")
     print(f"{'='*60}")
     
-    # Get doctors for refined matches
-    results = []
-    
-    for match in refined_matches:
-        disease_name = match["disease"]
-        specialist_needed = match["specialist"]
-        
-        conn = get_mysql_connection()
+    with mysql_connection() as conn:
         cursor = conn.cursor(dictionary=True)
+        near = (user_lat, user_lng, max_distance) if user_lat and user_lng else None
+        doctors_by_pair = fetch_doctors_for_matches(
+            cursor, [(match["disease"], match["specialist"]) for match in refined_matches], near
+        )
+        cursor.close()
+    
+    def disease_page(match):
+        """Rank, page and load slots for one disease; runs on the fan-out pool"""
+        # Rank and cut to one page before any per-doctor work
+        doctors, after = page_doctors(
+            doctors_by_pair[(match["disease"], match["specialist"])],
+            user_lat, user_lng, max_distance, page_size, ranking
+        )
         
-        query = """
-        SELECT 
-            d.doctor_id,
-            d.name AS doctor_name,
-            d.specialization,
-            d.contact_no,
-            h.name AS hospital_name,
-            h.location,
-            h.latitude,
-            h.longitude,
-            h.rating AS hospital_rating,
-            COALESCE(dde.success_rate, 0) AS success_rate,
-            COALESCE(dde.total_cases, 0) AS total_cases,
-            cf.base_fee
-        FROM doctor d
-        JOIN hospital h ON d.hospital_id = h.hospital_id
-        JOIN disease di ON di.name = %s
-        LEFT JOIN doctor_disease_expertise dde 
-            ON d.doctor_id = dde.doctor_id AND di.disease_id = dde.disease_id
-        LEFT JOIN consultation_fees cf 
-            ON d.doctor_id = cf.doctor_id AND cf.consultation_type = 'in-person'
-        WHERE d.specialization = %s
-        """
-        
-        cursor.execute(query, (disease_name, specialist_needed))
-        doctors = cursor.fetchall()
-        
-        # Get slots for each doctor
         for doc in doctors:
-            cursor.execute("""
-                SELECT slot_id, slot_date, slot_time 
-                FROM appointment_slots 
-                WHERE doctor_id = %s AND is_booked = FALSE 
-                AND slot_date >= CURDATE()
-                ORDER BY slot_date, slot_time 
-                LIMIT 5
-            """, (doc["doctor_id"],))
-            
-            slots = cursor.fetchall()
-            formatted_slots = []
-            for slot in slots:
-                formatted_slots.append({
-                    "slot_id": slot["slot_id"],
-                    "slot_date": slot["slot_date"].isoformat(),
-                    "slot_time": str(slot["slot_time"])
-                })
-            doc["available_slots"] = formatted_slots
-            
             #Convert Decimal to float for MongoDB
             doc["latitude"] = float(doc["latitude"])
             doc["longitude"] = float(doc["longitude"])
@@ -224,20 +304,28 @@ def submit_followup():
             if doc["base_fee"]:
                 doc["base_fee"] = float(doc["base_fee"])
         
-        cursor.close()
-        conn.close()
-        
+        attach_slots(None, doctors)
+        return doctors, after
+    
+    # Get doctors for refined matches
+    results = []
+    
+    for match, (doctors, after) in zip(refined_matches, map_concurrently(disease_page, refined_matches)):
         results.append({
-            "disease": disease_name,
+            "disease": match["disease"],
             "confidence": match["confidence"],
             "matched_symptoms": match["matched_symptoms"],
             "requires_urgent_care": match["requires_urgent_care"],
             "follow_up_questions": [],
-            "doctors": doctors[:10]
+            "doctors": doctors,
+            "next_cursor": page_cursor(
+                match["disease"], match["specialist"], user_lat, user_lng,
+                max_distance, page_size, ranking, after
+            )
         })
     
     # Store refined search in MongoDB
-    mongo_db["user_search_history"].insert_one({
+    search_history.log({
         "action": "refined_symptom_search",
         "timestamp": datetime.now(),
         "original_input": original_symptoms,
@@ -248,94 +336,133 @@ def submit_followup():
     return jsonify({"refined_matches": results})
 
 @app.route("/book-appointment", methods=["POST"])
+# Retries with the same Idempotency-Key (and double-clicks without one) get the first response back
+@idempotent(booking_requests, IDEMPOTENCY_SCOPE, implicit_fields=BOOKING_IDENTITY_FIELDS)
 def book_appointment():
     data = request.get_json()
     slot_id = data.get("slot_id")
     patient_id = data.get("patient_id")
     patient_name = data.get("patient_name", "Guest Patient")
+    hold_id = data.get("hold_id")  # from /hold-slot, optional
     
     if not slot_id or not patient_id:
         return jsonify({"error": "Missing slot_id or patient_id"}), 400
     
-    conn = get_mysql_connection()
+    conn = mysql_pool.acquire()
     cursor = conn.cursor(dictionary=True)
     
     try:
         # Check/create patient
-        cursor.execute("SELECT patient_id FROM patient WHERE patient_id = %s", (patient_id,))
+        cursor.execute(PATIENT_EXISTS_QUERY, (patient_id,))
         patient_exists = cursor.fetchone()
         
         if not patient_exists:
-            cursor.execute("INSERT INTO patient (patient_id, name) VALUES (%s, %s)", (patient_id, patient_name))
+            cursor.execute(INSERT_PATIENT_QUERY, (patient_id, patient_name))
             conn.commit()
         
-        # Get slot details (NO is_booked check - multiple bookings allowed)
-        cursor.execute("""
-            SELECT 
-                s.slot_id, s.slot_date, s.slot_time, s.doctor_id,
-                d.name AS doctor_name, d.specialization,
-                h.name AS hospital_name, h.location,
-                cf.base_fee
-            FROM appointment_slots s
-            JOIN doctor d ON s.doctor_id = d.doctor_id
-            JOIN hospital h ON d.hospital_id = h.hospital_id
-            LEFT JOIN consultation_fees cf 
-                ON d.doctor_id = cf.doctor_id AND cf.consultation_type = 'in-person'
-            WHERE s.slot_id = %s
-        """, (slot_id,))
-        
+        cursor.execute(SLOT_DETAILS_QUERY, (slot_id,))
         slot_details = cursor.fetchone()
         
         if not slot_details:
             return jsonify({"error": "Slot not found"}), 400
         
-        # Store booking in user_search_history with type="booking"
-        booking_record = {
-            "type": "booking", 
-            "action": "appointment_booking",
-            "patient_id": int(patient_id),
-            "patient_name": patient_name,
-            "slot_id": slot_id,
-            "doctor_id": slot_details["doctor_id"],
-            "doctor_name": slot_details["doctor_name"],
-            "specialization": slot_details["specialization"],
-            "hospital_name": slot_details["hospital_name"],
-            "location": slot_details["location"],
-            "appointment_date": slot_details["slot_date"].isoformat(),
-            "appointment_time": str(slot_details["slot_time"]),
-            "consultation_fee": float(slot_details["base_fee"]) if slot_details["base_fee"] else None,
-            "booking_timestamp": datetime.now(),
-            "status": "confirmed"
-        }
+        # Take the place before recording the booking; a full slot is refused
+        if hold_id:
+            if not confirm_hold(conn, hold_id, slot_id, patient_id):
+                return jsonify({"error": "Hold expired or not found"}), 409
+        elif not reserve_slot(conn, slot_id):
+            # Whatever cached list offered this slot is stale
+            invalidate_doctor_slots(slot_details["doctor_id"])
+            return jsonify({"error": "Slot is no longer available"}), 409
         
-        result = mongo_db["user_search_history"].insert_one(booking_record)
+        try:
+            result = mongo_db["user_search_history"].insert_one(
+                booking_record(slot_id, patient_id, patient_name, slot_details)
+            )
+        except Exception:
+            release_slot(conn, slot_id)
+            raise
         booking_id = str(result.inserted_id)
         print(f"✅ Booking saved to MongoDB patient_bookings collection")
-        conn.close()
         
-        return jsonify({
-            "success": True, 
-            "message": "Appointment booked successfully!",
-            "booking_id": booking_id,
-            "appointment_details": {
-                "booking_id": booking_id,
-                "patient_id": patient_id,
-                "doctor": slot_details["doctor_name"],
-                "hospital": slot_details["hospital_name"],
-                "date": slot_details["slot_date"].isoformat(),
-                "time": str(slot_details["slot_time"]),
-                "fee": slot_details["base_fee"]
-            }
-        })
+        # The booking exists from here on. A 5xx would free the Idempotency-Key
+        # and its retry would book again, so follow-up steps are best-effort
+        try:
+            record_patient_change(mongo_db, patient_id, APPOINTMENTS)
+            invalidate_doctor_slots(slot_details["doctor_id"])
+        except Exception as e:
+            print(f"⚠️ Booking {booking_id} saved, but its follow-up steps failed: {e}")
         
+        return jsonify(booking_response(booking_id, patient_id, slot_details))
+        
+    except HoldsUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    
     except Exception as e:
         print(f"❌ Booking error: {str(e)}")
         return jsonify({"error": f"Booking failed: {str(e)}"}), 500
     
     finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+        cursor.close()
+        mysql_pool.release(conn)
+
+@app.route("/hold-slot", methods=["POST"])
+def hold_appointment_slot():
+    """
+    Hold a place in a slot for SLOT_HOLD_SECONDS while the patient fills in
+    the booking; pass the hold_id to /book-appointment to confirm it.
+    """
+    data = request.get_json()
+    slot_id = data.get("slot_id")
+    patient_id = data.get("patient_id")
+    
+    if not slot_id or not patient_id:
+        return jsonify({"error": "Missing slot_id or patient_id"}), 400
+    
+    with mysql_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(SLOT_DETAILS_QUERY, (slot_id,))
+        slot_details = cursor.fetchone()
+        cursor.close()
+        
+        if not slot_details:
+            return jsonify({"error": "Slot not found"}), 400
+        
+        try:
+            hold_id = hold_slot(conn, slot_id, patient_id)
+        except HoldsUnavailable as e:
+            return jsonify({"error": str(e)}), 501
+    
+    invalidate_doctor_slots(slot_details["doctor_id"])
+    if hold_id is None:
+        return jsonify({"error": "Slot is no longer available"}), 409
+    
+    return jsonify({
+        "success": True,
+        "hold_id": hold_id,
+        "slot_id": slot_id,
+        "expires_in_seconds": SLOT_HOLD_SECONDS
+    })
+
+@app.route("/release-hold", methods=["POST"])
+def release_appointment_hold():
+    data = request.get_json()
+    hold_id = data.get("hold_id")
+    patient_id = data.get("patient_id")
+    
+    if not hold_id or not patient_id:
+        return jsonify({"error": "Missing hold_id or patient_id"}), 400
+    
+    with mysql_connection() as conn:
+        try:
+            slot_id = release_hold(conn, hold_id, patient_id)
+        except HoldsUnavailable as e:
+            return jsonify({"error": str(e)}), 501
+    
+    if slot_id is None:
+        return jsonify({"error": "Hold not found"}), 404
+    
+    return jsonify({"success": True, "slot_id": slot_id})
 
 @app.route("/cancel-appointment", methods=["POST"])
 def cancel_appointment():
@@ -349,25 +476,51 @@ def cancel_appointment():
     try:
         from bson.objectid import ObjectId
         
+        bookings = mongo_db["user_search_history"]
+        
         # Update status in user_search_history
-        result = mongo_db["user_search_history"].update_one(
+        booking = bookings.find_one_and_update(
             {
                 "_id": ObjectId(booking_id),
                 "patient_id": int(patient_id),
                 "type": "booking",
-                "status": "confirmed"
+                "$or": [
+                    {"status": "confirmed"},
+                    # A cancellation whose slot release failed is finished by its retry
+                    {"status": "cancelled", "slot_reserved": True, "slot_released": {"$ne": True}}
+                ]
             },
             {
                 "$set": {
                     "status": "cancelled",
                     "cancelled_at": datetime.now()
                 }
-            }
+            },
+            projection={"doctor_id": 1, "slot_id": 1, "slot_reserved": 1}
         )
         
-        if result.modified_count == 0:
+        if booking is None:
             return jsonify({"error": "Appointment not found or already cancelled"}), 404
         
+        # Claimed before the MySQL release so concurrent cancels give the place back once;
+        # a failed release drops the claim and the retry releases it
+        if booking.get("slot_reserved") and bookings.find_one_and_update(
+            {"_id": booking["_id"], "slot_released": {"$ne": True}},
+            {"$set": {"slot_released": True}}
+        ):
+            try:
+                with mysql_connection() as conn:
+                    release_slot(conn, booking["slot_id"])
+            except Exception:
+                bookings.update_one({"_id": booking["_id"]}, {"$set": {"slot_released": False}})
+                raise
+        
+        try:
+            record_patient_change(mongo_db, patient_id, APPOINTMENTS)
+            invalidate_doctor_slots(booking.get("doctor_id"))
+        except Exception as e:
+            print(f"⚠️ Booking {booking_id} cancelled, but its follow-up steps failed: {e}")
+        
         return jsonify({
             "success": True,
             "message": "Appointment cancelled successfully"
@@ -377,11 +530,56 @@ def cancel_appointment():
         print(f"❌ Cancellation error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/refresh-knowledge", methods=["POST"])
+def refresh_knowledge():
+    """Rebuild the symptom index and follow-up catalogue immediately"""
+    index = refresh_symptom_index()
+    catalogue = refresh_followup_catalogue()
+    return jsonify({
+        "success": True,
+        "diseases": len(index),
+        "symptoms": len(index.postings),
+        "followup_diseases": len(catalogue)
+    })
+
+@app.route("/warm-slots", methods=["POST"])
+def warm_slots():
+    """Preload slot availability for the given doctors, or the most requested ones"""
+    data = request.get_json(silent=True) or {}
+    doctor_ids = data.get("doctor_ids")
+    
+    with mysql_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        if doctor_ids is not None:
+            warmed = warm_slot_cache(cursor, doctor_ids)
+        else:
+            warmed = warm_slot_cache(cursor, limit=int(data.get("limit", SLOT_CACHE_WARM_SIZE)))
+        cursor.close()
+    
+    return jsonify({"success": True, "doctors_warmed": warmed})
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    """Runtime counters for sizing caches and queues"""
+    return jsonify({
+        "diagnosis_cache": get_cache_stats(),
+        "search_history": dict(search_history.stats),
+        "mysql_pool": mysql_pool.stats(),
+        "hospital_geo_index": get_hospital_index_stats(),
+        "doctor_directory": get_directory_stats(),
+        "slot_cache": slot_cache.stats()
+    })
+
 # Get patient appointment history
 @app.route("/appointment-history/<int:patient_id>", methods=["GET"])
 def get_appointment_history(patient_id):
+    return conditional_patient_response(
+        mongo_db, patient_id, [APPOINTMENTS], lambda: appointment_history_response(patient_id)
+    )
+
+def appointment_history_response(patient_id):
     # Get only booking records for this patient
-    appointments = list(mongo_db["user_search_history"].find(
+    appointments = mongo_db["user_search_history"].find(
     {
         "patient_id": patient_id,
         "type": "booking"
@@ -389,13 +587,16 @@ def get_appointment_history(patient_id):
     {"_id": 1, "booking_timestamp": 1, "doctor_name": 1, "hospital_name": 1, 
      "location": 1, "appointment_date": 1, "appointment_time": 1, 
      "consultation_fee": 1, "specialization": 1, "status": 1, "cancelled_at": 1}
-).sort("booking_timestamp", -1))  # ✅ Change from "timestamp" to "booking_timestamp"
+).sort("booking_timestamp", -1)  # ✅ Change from "timestamp" to "booking_timestamp"
     
-    # Convert ObjectId to string for JSON
-    for apt in appointments:
-        apt["booking_id"] = str(apt.pop("_id"))
+    def as_appointment(apt):
+        apt["booking_id"] = apt.pop("_id")
+        return apt
     
-    return jsonify({"appointments": appointments})
+    # Encoded while the cursor is read, so long histories are never built up in memory
+    return Response(stream_json_list("appointments", appointments, as_appointment), mimetype="application/json")
 
 if __name__ == "__main__":
+    refresh_symptom_index()
+    refresh_followup_catalogue()
     app.run(debug=True)
\ No newline at end of file
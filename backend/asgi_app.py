@@ -0,0 +1,431 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiomysql
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # starlette's own adapter is deprecated but still works
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+from app import app as flask_app, page_cursor
+from nlp import analyze_symptoms_advanced, refresh_symptom_index, refresh_followup_catalogue, search_history
+from db_config import MYSQL_CONFIG, POOL_SIZE, POOL_MAX_OVERFLOW, mysql_connection
+from doctor_lookup import (
+    GEO_FILTER, HOSPITAL_INDEX_REFRESH_SECONDS, get_hospital_geo_index, current_hospital_geo_index,
+    doctor_query, group_doctor_rows, slots_query, group_slot_rows, cached_slots, cache_slots,
+    count_slot_requests, invalidate_doctor_slots, resolve_page_size, resolve_ranking, page_doctors,
+    resolve_doctor_fields, select_doctor_fields
+)
+from doctor_directory import (
+    DIRECTORY_ENABLED, DIRECTORY_REFRESH_SECONDS, get_doctor_directory, current_doctor_directory
+)
+from serializers import dumps_bytes
+from patient_versions import APPOINTMENTS, record_patient_change_async
+from slot_reservations import (
+    RESERVE_SLOT, RELEASE_SLOT, RESERVE_SINGLE_SLOT, RELEASE_SINGLE_SLOT, CONFIRM_HOLD,
+    HOLD_SWEEP_INTERVAL, reservation_schema, reclaim_expired_holds, reclaim_due, sweep_expired_holds
+)
+from compression import COMPRESSION_ENABLED, COMPRESSION_MIN_BYTES, GZIP_LEVEL
+from bookings import (
+    PATIENT_EXISTS_QUERY, INSERT_PATIENT_QUERY, SLOT_DETAILS_QUERY, BOOKING_IDENTITY_FIELDS, IDEMPOTENCY_SCOPE,
+    booking_record, booking_response
+)
+from idempotency import IDEMPOTENCY_COLLECTION, AsyncIdempotencyStore, idempotency_claim, invalid_key, stored_outcome, MAX_KEY_LENGTH
+from datetime import datetime
+
+# ============================================
+# ASYNC (ASGI) SERVING MODE
+# ============================================
+# Optional alternative to `python app.py`:
+#
+#   uvicorn asgi_app:app --workers 4
+#
+# /search, /submit-followup and /book-appointment run natively on the event
+# loop with non-blocking drivers (aiomysql, motor), so a worker keeps serving
+# other requests while one waits on MySQL or MongoDB. Independent I/O within
+# a request (slot loading for each matched disease) runs concurrently with
+# asyncio.gather. Every other route, including the prescription blueprint,
+# is the unchanged Flask app mounted through WSGIMiddleware.
+#
+# Doctor directory and hospital geo index refreshes, and the sweep for
+# expired slot holds, use blocking queries, so they run on a worker thread
+# in a background task; the request path only reads the current snapshots.
+
+SNAPSHOT_REFRESH_SECONDS = min(DIRECTORY_REFRESH_SECONDS, HOSPITAL_INDEX_REFRESH_SECONDS, HOLD_SWEEP_INTERVAL or float("inf"))
+
+_mysql = None
+_mongo_db = None
+_reservation_schema = None
+_booking_requests = None
+
+class FlaskJSONResponse(Response):
+    """JSON rendered like Flask's jsonify, so responses match the WSGI app byte for byte"""
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps_bytes(content) + b"\n"
+
+async def fetch_all(query, params):
+    async with _mysql.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(query, params)
+            return await cursor.fetchall()
+
+async def fetch_doctors_for_matches_async(pairs, near=None, fields=None):
+    """Async counterpart of doctor_lookup.fetch_doctors_for_matches"""
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+
+    hospital_distances = None
+    geo_index = current_hospital_geo_index()
+    if near and GEO_FILTER == "memory" and geo_index is not None:
+        hospital_distances = geo_index.within(float(near[0]), float(near[1]), float(near[2]))
+        if not hospital_distances:
+            return {pair: [] for pair in pairs}
+
+    directory = current_doctor_directory()
+    if DIRECTORY_ENABLED and directory is not None and not (near and GEO_FILTER == "mysql"):
+        return directory.lookup(pairs, hospital_distances)
+
+    query, params = doctor_query(pairs, near, hospital_distances, fields)
+    return group_doctor_rows(await fetch_all(query, params), pairs, hospital_distances)
+
+async def attach_slots_async(doctors):
+    """Async counterpart of doctor_lookup.attach_slots (shares its slot cache)"""
+    doctor_ids = [doc["doctor_id"] for doc in doctors]
+    count_slot_requests(doctor_ids)
+
+    slots_by_doctor, missing = cached_slots(doctor_ids)
+    if missing:
+        fetched = group_slot_rows(await fetch_all(*slots_query(missing)), missing)
+        cache_slots(fetched)
+        slots_by_doctor.update(fetched)
+    for doc in doctors:
+        doc["available_slots"] = slots_by_doctor[doc["doctor_id"]]
+
+async def search_doctors(matches, user_lat, user_lng, max_distance, page_size, ranking, prepare=None, fields=None):
+    """[(doctors, after), ...] per match: one doctor lookup, then all slot loads at once"""
+    near = (user_lat, user_lng, max_distance) if user_lat and user_lng else None
+    doctors_by_pair = await fetch_doctors_for_matches_async(
+        [(match["disease"], match["specialist"]) for match in matches], near, fields
+    )
+
+    async def disease_page(match):
+        doctors, after = page_doctors(
+            doctors_by_pair[(match["disease"], match["specialist"])],
+            user_lat, user_lng, max_distance, page_size, ranking
+        )
+        if prepare:
+            prepare(doctors)
+        if fields is None or "available_slots" in fields:
+            await attach_slots_async(doctors)
+        return select_doctor_fields(doctors, fields), after
+
+    return await asyncio.gather(*(disease_page(match) for match in matches))
+
+async def execute(conn, query, params):
+    """Run a write on an autocommit connection; the number of affected rows"""
+    async with conn.cursor() as cursor:
+        return await cursor.execute(query, params)
+
+def reclaim_slot_holds(slot_id):
+    # Locks hold rows in a transaction, so it uses a blocking connection on a worker thread
+    with mysql_connection() as conn:
+        return reclaim_expired_holds(conn, slot_id)
+
+async def reserve_slot_async(conn, slot_id):
+    """Async counterpart of slot_reservations.reserve_slot"""
+    schema = _reservation_schema
+    if not schema["capacity"]:
+        return await execute(conn, RESERVE_SINGLE_SLOT, (slot_id,)) == 1
+    if await execute(conn, RESERVE_SLOT, (slot_id,)) == 1:
+        return True
+    # A full slot may only be full of abandoned holds
+    if schema["holds"] and reclaim_due(slot_id) and await asyncio.to_thread(reclaim_slot_holds, slot_id):
+        return await execute(conn, RESERVE_SLOT, (slot_id,)) == 1
+    return False
+
+async def release_slot_async(conn, slot_id):
+    if _reservation_schema["capacity"]:
+        await execute(conn, RELEASE_SLOT, (1, slot_id, 1))
+    else:
+        await execute(conn, RELEASE_SINGLE_SLOT, (slot_id,))
+
+def doctors_to_floats(doctors):
+    #Convert Decimal to float for MongoDB
+    for doc in doctors:
+        doc["latitude"] = float(doc["latitude"])
+        doc["longitude"] = float(doc["longitude"])
+        doc["hospital_rating"] = float(doc["hospital_rating"])
+        doc["success_rate"] = float(doc["success_rate"])
+        if doc["base_fee"]:
+            doc["base_fee"] = float(doc["base_fee"])
+
+# ============================================
+# ROUTES
+# ============================================
+
+async def search_disease(request):
+    data = await request.json()
+    symptoms = data.get("symptoms")
+    user_lat = data.get("latitude")
+    user_lng = data.get("longitude")
+    max_distance = data.get("max_distance_km", 20)
+    page_size = resolve_page_size(data.get("page_size"))
+    ranking = resolve_ranking(data.get("ranking"))
+
+    if not symptoms:
+        return FlaskJSONResponse({"error": "No symptoms provided"}, status_code=400)
+
+    try:
+        fields = resolve_doctor_fields(data.get("fields"))
+    except ValueError as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=400)
+
+    disease_matches = await run_in_threadpool(analyze_symptoms_advanced, symptoms)
+
+    if not disease_matches:
+        return FlaskJSONResponse({"message": "No matching disease found"})
+
+    pages = await search_doctors(
+        disease_matches, user_lat, user_lng, max_distance, page_size, ranking, fields=fields
+    )
+
+    results = []
+    for match, (doctors, after) in zip(disease_matches, pages):
+        results.append({
+            "disease": match["disease"],
+            "confidence": match["confidence"],
+            "matched_symptoms": match["matched_symptoms"],
+            "requires_urgent_care": match["requires_urgent_care"],
+            "follow_up_questions": match.get("follow_up_questions", []),
+            "doctors": doctors,
+            "next_cursor": page_cursor(
+                match["disease"], match["specialist"], user_lat, user_lng,
+                max_distance, page_size, ranking, after
+            )
+        })
+
+    return FlaskJSONResponse({"matches": results})
+
+async def submit_followup(request):
+    """Process follow-up answers and refine diagnosis"""
+    data = await request.json()
+    original_symptoms = data.get("original_symptoms")
+    follow_up_answers = data.get("follow_up_answers")
+    user_lat = data.get("latitude")
+    user_lng = data.get("longitude")
+    max_distance = data.get("max_distance_km", 20)
+    page_size = resolve_page_size(data.get("page_size"))
+    ranking = resolve_ranking(data.get("ranking"))
+
+    if not original_symptoms or not follow_up_answers:
+        return FlaskJSONResponse({"error": "Missing symptoms or answers"}, status_code=400)
+
+    # Re-analyze with follow-up data (the refined record below is the only history entry)
+    refined_matches = await run_in_threadpool(
+        analyze_symptoms_advanced, original_symptoms, follow_up_answers, log_history=False
+    )
+    print(f"✅ REFINED RESULTS: {len(refined_matches)} matches")
+
+    pages = await search_doctors(
+        refined_matches, user_lat, user_lng, max_distance, page_size, ranking, prepare=doctors_to_floats
+    )
+
+    results = []
+    for match, (doctors, after) in zip(refined_matches, pages):
+        results.append({
+            "disease": match["disease"],
+            "confidence": match["confidence"],
+            "matched_symptoms": match["matched_symptoms"],
+            "requires_urgent_care": match["requires_urgent_care"],
+            "follow_up_questions": [],
+            "doctors": doctors,
+            "next_cursor": page_cursor(
+                match["disease"], match["specialist"], user_lat, user_lng,
+                max_distance, page_size, ranking, after
+            )
+        })
+
+    # Queued for the background history writer; does not block the loop
+    search_history.log({
+        "action": "refined_symptom_search",
+        "timestamp": datetime.now(),
+        "original_input": original_symptoms,
+        "follow_up_answers": follow_up_answers,
+        "refined_results": results
+    })
+
+    return FlaskJSONResponse({"refined_matches": results})
+
+async def book_appointment(request):
+    """Idempotent like the Flask route: a repeated key gets the first response back"""
+    data = await request.json()
+    header_key = request.headers.get("Idempotency-Key")
+    if invalid_key(header_key):
+        return FlaskJSONResponse({"error": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"}, status_code=400)
+
+    key_id, fingerprint, ttl = idempotency_claim(IDEMPOTENCY_SCOPE, header_key, data, BOOKING_IDENTITY_FIELDS)
+    existing = await _booking_requests.claim(key_id, fingerprint, ttl)
+    if existing is not None:
+        status_code, body, replayed = stored_outcome(existing, fingerprint)
+        headers = {"Idempotent-Replayed": "true"} if replayed else None
+        return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+    try:
+        response = await place_booking(data)
+    except Exception:
+        await _booking_requests.release(key_id)
+        raise
+    if response.status_code >= 500:
+        await _booking_requests.release(key_id)
+    else:
+        await _booking_requests.complete(key_id, response.status_code, response.body.decode("utf-8"), ttl)
+    return response
+
+async def place_booking(data):
+    slot_id = data.get("slot_id")
+    patient_id = data.get("patient_id")
+    patient_name = data.get("patient_name", "Guest Patient")
+    hold_id = data.get("hold_id")  # from /hold-slot, optional
+
+    if not slot_id or not patient_id:
+        return FlaskJSONResponse({"error": "Missing slot_id or patient_id"}, status_code=400)
+    if hold_id and not _reservation_schema["holds"]:
+        return FlaskJSONResponse({"error": "Slot holds need setup_slot_reservations.py"}, status_code=501)
+
+    try:
+        async with _mysql.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                # Check/create patient
+                await cursor.execute(PATIENT_EXISTS_QUERY, (patient_id,))
+                if not await cursor.fetchone():
+                    await cursor.execute(INSERT_PATIENT_QUERY, (patient_id, patient_name))
+
+                await cursor.execute(SLOT_DETAILS_QUERY, (slot_id,))
+                slot_details = await cursor.fetchone()
+
+            if not slot_details:
+                return FlaskJSONResponse({"error": "Slot not found"}, status_code=400)
+
+            # Take the place before recording the booking; a full slot is refused
+            if hold_id:
+                if await execute(conn, CONFIRM_HOLD, (hold_id, slot_id, patient_id)) != 1:
+                    return FlaskJSONResponse({"error": "Hold expired or not found"}, status_code=409)
+            elif not await reserve_slot_async(conn, slot_id):
+                invalidate_doctor_slots(slot_details["doctor_id"])
+                return FlaskJSONResponse({"error": "Slot is no longer available"}, status_code=409)
+
+            try:
+                result = await _mongo_db["user_search_history"].insert_one(
+                    booking_record(slot_id, patient_id, patient_name, slot_details)
+                )
+            except Exception:
+                await release_slot_async(conn, slot_id)
+                raise
+
+        booking_id = str(result.inserted_id)
+        print(f"✅ Booking saved to MongoDB patient_bookings collection")
+
+        # Best-effort once the booking exists, as in the Flask route
+        try:
+            await record_patient_change_async(_mongo_db, patient_id, APPOINTMENTS)
+            invalidate_doctor_slots(slot_details["doctor_id"])
+        except Exception as e:
+            print(f"⚠️ Booking {booking_id} saved, but its follow-up steps failed: {e}")
+
+        return FlaskJSONResponse(booking_response(booking_id, patient_id, slot_details))
+
+    except Exception as e:
+        print(f"❌ Booking error: {str(e)}")
+        return FlaskJSONResponse({"error": f"Booking failed: {str(e)}"}, status_code=500)
+
+# ============================================
+# STARTUP / SHUTDOWN
+# ============================================
+
+def detect_reservation_schema():
+    with mysql_connection() as conn:
+        return reservation_schema(conn)
+
+def refresh_lookup_snapshots():
+    """
+    Refresh the doctor directory and hospital geo index when due, and
+    reclaim expired slot holds (blocking)
+    """
+    with mysql_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        if DIRECTORY_ENABLED:
+            get_doctor_directory(cursor)
+        if GEO_FILTER == "memory":
+            get_hospital_geo_index(cursor)
+        cursor.close()
+        sweep_expired_holds(conn)
+
+async def refresh_snapshots_forever():
+    while True:
+        await asyncio.sleep(SNAPSHOT_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(refresh_lookup_snapshots)
+        except Exception as e:
+            print(f"⚠️ Snapshot refresh failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    global _mysql, _mongo_db, _reservation_schema, _booking_requests
+    await asyncio.to_thread(refresh_symptom_index)
+    await asyncio.to_thread(refresh_followup_catalogue)
+    await asyncio.to_thread(refresh_lookup_snapshots)
+    _reservation_schema = await asyncio.to_thread(detect_reservation_schema)
+
+    _mysql = await aiomysql.create_pool(
+        host=MYSQL_CONFIG["host"],
+        user=MYSQL_CONFIG["user"],
+        password=MYSQL_CONFIG["password"],
+        db=MYSQL_CONFIG["database"],
+        minsize=1,
+        maxsize=POOL_SIZE + POOL_MAX_OVERFLOW,
+        # Each statement sees fresh data and pooled connections hold no open transaction
+        autocommit=True
+    )
+    mongo_client = AsyncIOMotorClient("mongodb://localhost:27017/")
+    _mongo_db = mongo_client["mediquery_nlp"]
+    _booking_requests = AsyncIdempotencyStore(_mongo_db[IDEMPOTENCY_COLLECTION])
+    await _booking_requests.ensure_indexes()
+    refresher = asyncio.create_task(refresh_snapshots_forever())
+    print("🚀 Async serving mode ready")
+
+    try:
+        yield
+    finally:
+        refresher.cancel()
+        _mysql.close()
+        await _mysql.wait_closed()
+        mongo_client.close()
+
+app = Starlette(
+    routes=[
+        Route("/search", search_disease, methods=["POST"]),
+        Route("/submit-followup", submit_followup, methods=["POST"]),
+        Route("/book-appointment", book_appointment, methods=["POST"]),
+        # Everything else (prescriptions, cancellations, history, stats, ...) stays on Flask
+        Mount("/", app=WSGIMiddleware(flask_app))
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        # Flask responses arrive already compressed by compress_response and are left alone
+        *([Middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_BYTES, compresslevel=GZIP_LEVEL)]
+          if COMPRESSION_ENABLED else [])
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,137 @@
+# Flash-crowd benchmark for slot reservations: many clients race for a few
+# slots at once, as when a popular doctor's slots open at 9 am. Creates
+# temporary slots a year ahead for one doctor and removes them afterwards.
+#
+#   python benchmark_slot_reservations.py --clients 64 --slots 5 --capacity 3
+#
+# Reports reservations/sec and latency, and checks that no slot was handed
+# out more often than its capacity. --strategy locking runs the
+# SELECT ... FOR UPDATE variant for comparison.
+import argparse
+import random
+import threading
+import time
+
+from db_config import get_mysql_connection
+from slot_reservations import reservation_schema, reserve_slot
+
+CREATE_SLOT = """
+INSERT INTO appointment_slots (doctor_id, slot_date, slot_time, is_booked{capacity_column})
+VALUES (%s, CURDATE() + INTERVAL 365 DAY, %s, FALSE{capacity_value})
+"""
+
+LOCK_SLOT = "SELECT booked_count, capacity FROM appointment_slots WHERE slot_id = %s FOR UPDATE"
+TAKE_LOCKED_PLACE = """
+UPDATE appointment_slots
+SET booked_count = booked_count + 1, is_booked = booked_count >= capacity
+WHERE slot_id = %s
+"""
+
+def reserve_with_lock(conn, slot_id):
+    """Read-check-write under a row lock (two statements while the lock is held)"""
+    cursor = conn.cursor()
+    cursor.execute(LOCK_SLOT, (slot_id,))
+    booked_count, capacity = cursor.fetchone()
+    reserved = booked_count < capacity
+    if reserved:
+        cursor.execute(TAKE_LOCKED_PLACE, (slot_id,))
+    conn.commit()
+    cursor.close()
+    return reserved
+
+def create_slots(conn, count, capacity, capacity_mode):
+    cursor = conn.cursor()
+    cursor.execute("SELECT doctor_id FROM doctor ORDER BY doctor_id LIMIT 1")
+    doctor_id = cursor.fetchone()[0]
+    query = CREATE_SLOT.format(
+        capacity_column=", capacity" if capacity_mode else "",
+        capacity_value=", %s" if capacity_mode else ""
+    )
+    slot_ids = []
+    for i in range(count):
+        params = (doctor_id, f"{9 + i // 4:02d}:{(i % 4) * 15:02d}:00")
+        cursor.execute(query, params + ((capacity,) if capacity_mode else ()))
+        slot_ids.append(cursor.lastrowid)
+    conn.commit()
+    cursor.close()
+    return slot_ids
+
+def delete_slots(conn, slot_ids):
+    cursor = conn.cursor()
+    placeholders = ", ".join(["%s"] * len(slot_ids))
+    cursor.execute(f"DELETE FROM appointment_slots WHERE slot_id IN ({placeholders})", tuple(slot_ids))
+    conn.commit()
+    cursor.close()
+
+def run_clients(slot_ids, clients, attempts, strategy):
+    reserve = reserve_with_lock if strategy == "locking" else reserve_slot
+    start = threading.Barrier(clients + 1)
+    lock = threading.Lock()
+    successes = {slot_id: 0 for slot_id in slot_ids}
+    latencies = []
+    last_success = [0.0]
+
+    def client():
+        conn = get_mysql_connection()
+        mine = []
+        won = []
+        start.wait()
+        for _ in range(attempts):
+            slot_id = random.choice(slot_ids)
+            began = time.perf_counter()
+            reserved = reserve(conn, slot_id)
+            finished = time.perf_counter()
+            if reserved:
+                won.append((slot_id, finished))
+            mine.append(finished - began)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            for slot_id, finished in won:
+                successes[slot_id] += 1
+                last_success[0] = max(last_success[0], finished)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    return elapsed, max(last_success[0] - began, 0.0), successes, sorted(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description="Flash-crowd benchmark for slot reservations")
+    parser.add_argument("--clients", type=int, default=64, help="concurrent clients (one connection each)")
+    parser.add_argument("--attempts", type=int, default=20, help="reservation attempts per client")
+    parser.add_argument("--slots", type=int, default=5, help="slots fought over")
+    parser.add_argument("--capacity", type=int, default=1, help="places per slot (needs setup_slot_reservations.py)")
+    parser.add_argument("--strategy", choices=["conditional", "locking"], default="conditional")
+    args = parser.parse_args()
+
+    conn = get_mysql_connection()
+    capacity_mode = reservation_schema(conn)["capacity"]
+    if not capacity_mode and (args.capacity != 1 or args.strategy == "locking"):
+        parser.error("--capacity and --strategy locking need setup_slot_reservations.py")
+
+    slot_ids = create_slots(conn, args.slots, args.capacity, capacity_mode)
+    try:
+        elapsed, sold_out, successes, latencies = run_clients(slot_ids, args.clients, args.attempts, args.strategy)
+    finally:
+        delete_slots(conn, slot_ids)
+        conn.close()
+
+    total = len(latencies)
+    reserved = sum(successes.values())
+    overbooked = {slot_id: count for slot_id, count in successes.items() if count > args.capacity}
+    print(f"🏁 {args.strategy}: {args.clients} clients, {args.slots} slots x {args.capacity} places")
+    print(f"   attempts:     {total} in {elapsed:.2f}s ({total / elapsed:.0f}/s)")
+    print(f"   reservations: {reserved}, expected {args.slots * args.capacity}")
+    if sold_out:
+        print(f"   booked out:   {sold_out * 1000:.1f} ms after the crowd started ({reserved / sold_out:.0f} bookings/s)")
+    print(f"   latency ms:   p50 {latencies[total // 2] * 1000:.2f}  p99 {latencies[int(total * 0.99) - 1] * 1000:.2f}")
+    print("❌ Overbooked slots: " + str(overbooked) if overbooked else "✅ No slot overbooked")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+# ============================================
+# APPOINTMENT BOOKING
+# ============================================
+# SQL and record shapes shared by the Flask /book-appointment route and the
+# async one in asgi_app.py, so both write identical booking documents.
+
+PATIENT_EXISTS_QUERY = "SELECT patient_id FROM patient WHERE patient_id = %s"
+INSERT_PATIENT_QUERY = "INSERT INTO patient (patient_id, name) VALUES (%s, %s)"
+
+# A repeat of these within the implicit idempotency window is the same booking (double-click)
+BOOKING_IDENTITY_FIELDS = ("patient_id", "slot_id", "hold_id")
+IDEMPOTENCY_SCOPE = "book-appointment"
+
+# No availability check here; places are taken by slot_reservations
+SLOT_DETAILS_QUERY = """
+    SELECT 
+        s.slot_id, s.slot_date, s.slot_time, s.doctor_id,
+        d.name AS doctor_name, d.specialization,
+        h.name AS hospital_name, h.location,
+        cf.base_fee
+    FROM appointment_slots s
+    JOIN doctor d ON s.doctor_id = d.doctor_id
+    JOIN hospital h ON d.hospital_id = h.hospital_id
+    LEFT JOIN consultation_fees cf 
+        ON d.doctor_id = cf.doctor_id AND cf.consultation_type = 'in-person'
+    WHERE s.slot_id = %s
+"""
+
+def booking_record(slot_id, patient_id, patient_name, slot_details):
+    """Booking document stored in user_search_history with type="booking" """
+    return {
+        "type": "booking", 
+        "action": "appointment_booking",
+        "patient_id": int(patient_id),
+        "patient_name": patient_name,
+        "slot_id": slot_id,
+        "doctor_id": slot_details["doctor_id"],
+        "doctor_name": slot_details["doctor_name"],
+        "specialization": slot_details["specialization"],
+        "hospital_name": slot_details["hospital_name"],
+        "location": slot_details["location"],
+        "appointment_date": slot_details["slot_date"].isoformat(),
+        "appointment_time": str(slot_details["slot_time"]),
+        "consultation_fee": float(slot_details["base_fee"]) if slot_details["base_fee"] else None,
+        "booking_timestamp": datetime.now(),
+        "status": "confirmed",
+        # Cancelling gives the place back only for bookings that took one
+        "slot_reserved": True
+    }
+
+def booking_response(booking_id, patient_id, slot_details):
+    return {
+        "success": True, 
+        "message": "Appointment booked successfully!",
+        "booking_id": booking_id,
+        "appointment_details": {
+            "booking_id": booking_id,
+            "patient_id": patient_id,
+            "doctor": slot_details["doctor_name"],
+            "hospital": slot_details["hospital_name"],
+            "date": slot_details["slot_date"].isoformat(),
+            "time": str(slot_details["slot_time"]),
+            "fee": slot_details["base_fee"]
+        }
+    }
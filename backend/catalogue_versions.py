@@ -0,0 +1,28 @@
+from datetime import datetime
+
+# ============================================
+# CATALOGUE VERSION STAMPS
+# ============================================
+# One document per Mongo catalogue ({_id: collection name, version: n}).
+# Anything that rewrites medical_knowledge or disease_followup_questions
+# bumps the stamp; the API compares stamps to reload its in-memory copies.
+
+VERSIONS_COLLECTION = "catalogue_versions"
+
+MEDICAL_KNOWLEDGE = "medical_knowledge"
+FOLLOWUP_QUESTIONS = "disease_followup_questions"
+
+def bump_catalogue_version(db, name):
+    """Mark a catalogue as changed"""
+    db[VERSIONS_COLLECTION].update_one(
+        {"_id": name},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now()}},
+        upsert=True
+    )
+
+def get_catalogue_versions(db, names):
+    """Current version of each catalogue (0 if never stamped)"""
+    versions = {name: 0 for name in names}
+    for doc in db[VERSIONS_COLLECTION].find({"_id": {"$in": list(names)}}):
+        versions[doc["_id"]] = doc.get("version", 0)
+    return versions
@@ -1,5 +1,6 @@
 from pymongo import MongoClient
 from datetime import datetime
+from catalogue_versions import MEDICAL_KNOWLEDGE, bump_catalogue_version
 
 # Connect to MongoDB
 client = MongoClient("mongodb://localhost:27017/")
@@ -274,6 +275,9 @@ def setup_complete_medical_knowledge():
     db["medical_knowledge"].create_index([("symptoms.name", 1)])
     print(f"📊 Created indexes on 'disease' and 'symptoms.name'")
     
+    # Let running API servers know the knowledge base changed
+    bump_catalogue_version(db, MEDICAL_KNOWLEDGE)
+    
     # Verify data
     print(f"\n{'='*60}")
     print(f"📋 VERIFICATION")
@@ -0,0 +1,77 @@
+import gzip
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency, responses fall back to gzip
+    brotli = None
+
+# ============================================
+# RESPONSE COMPRESSION
+# ============================================
+# Responses are compressed with brotli or gzip, whichever the client prefers
+# in Accept-Encoding (brotli only when the brotli module is installed).
+# Buffered responses are only compressed from COMPRESSION_MIN_BYTES up;
+# streamed responses (e.g. /prescriptions) have no size up front and are
+# always compressed chunk by chunk.
+
+COMPRESSION_ENABLED = os.environ.get("MEDIQUERY_COMPRESSION", "1") == "1"
+COMPRESSION_MIN_BYTES = int(os.environ.get("MEDIQUERY_COMPRESSION_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("MEDIQUERY_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("MEDIQUERY_BROTLI_QUALITY", 4))
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/javascript", "image/svg+xml"}
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+def _compressible(response):
+    if response.direct_passthrough or response.status_code in (204, 206, 304) or response.status_code < 200:
+        return False
+    if "Content-Encoding" in response.headers:
+        return False
+    return response.mimetype in COMPRESSIBLE_MIMETYPES or response.mimetype.startswith("text/")
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def _compress_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+def compress_response(response):
+    """after_request hook: compress the body if the client accepts it"""
+    if not COMPRESSION_ENABLED or not _compressible(response):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_BYTES:
+            return response
+        response.set_data(_compress(data, encoding))
+
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -1,10 +1,155 @@
 import mysql.connector
+from contextlib import contextmanager
+import os
+import queue
+import threading
+import time
+
+MYSQL_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": " ",#enter the password
+    "database": "mediquery"
+}
+
+# Connection pool sizing: POOL_SIZE connections are kept open, up to
+# POOL_MAX_OVERFLOW more are opened under load and closed when returned,
+# and a checkout waits at most POOL_TIMEOUT seconds for a free connection
+POOL_SIZE = int(os.environ.get("MEDIQUERY_MYSQL_POOL_SIZE", 10))
+POOL_MAX_OVERFLOW = int(os.environ.get("MEDIQUERY_MYSQL_POOL_OVERFLOW", 10))
+POOL_TIMEOUT = float(os.environ.get("MEDIQUERY_MYSQL_POOL_TIMEOUT", 5))
 
 def get_mysql_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password=" ",#enter the password
-        database="mediquery"
-    )
- 
\ No newline at end of file
+    """Open a dedicated (unpooled) connection, e.g. for setup scripts"""
+    return mysql.connector.connect(**MYSQL_CONFIG)
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    def __init__(self, size, max_overflow, timeout, connect=get_mysql_connection):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0
+        }
+
+    def acquire(self):
+        """Borrow a healthy connection, opening one if the pool has room"""
+        started = time.monotonic()
+        conn = None
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.size + self.max_overflow
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No MySQL connection available after {self.timeout}s")
+
+        conn = self._check_health(conn)
+
+        waited_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["total_wait_ms"] += waited_ms
+            self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], waited_ms)
+        return conn
+
+    def release(self, conn):
+        """Return a connection; overflow and broken connections are closed"""
+        with self._lock:
+            self._in_use -= 1
+
+        try:
+            # Drop any transaction state left by the borrower
+            conn.rollback()
+            healthy = conn.is_connected()
+        except Exception:
+            healthy = False
+
+        if healthy and self._idle.qsize() < self.size:
+            self._idle.put(conn)
+            return
+
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _check_health(self, conn):
+        """Ping on borrow and transparently replace dead connections"""
+        try:
+            conn.ping(reconnect=True, attempts=1, delay=0)
+            return conn
+        except Exception:
+            pass
+
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._stats["reconnects"] += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._stats["checkouts"]
+            capacity = self.size + self.max_overflow
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open_connections": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "utilization": round(self._in_use / capacity, 4) if capacity else 0.0,
+                "checkouts": checkouts,
+                "timeouts": self._stats["timeouts"],
+                "reconnects": self._stats["reconnects"],
+                "avg_wait_ms": round(self._stats["total_wait_ms"] / checkouts, 3) if checkouts else 0.0,
+                "max_wait_ms": round(self._stats["max_wait_ms"], 3)
+            }
+
+mysql_pool = ConnectionPool(POOL_SIZE, POOL_MAX_OVERFLOW, POOL_TIMEOUT)
+
+@contextmanager
+def mysql_connection():
+    """Borrow a pooled connection; it always goes back to the pool"""
+    conn = mysql_pool.acquire()
+    try:
+        yield conn
+    finally:
+        mysql_pool.release(conn)
@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+
+# ============================================
+# DOCTOR DIRECTORY SNAPSHOT
+# ============================================
+# Read-only, in-process copy of the rarely-changing directory tables
+# (hospital, doctor, expertise, fees, disease). Searches resolve
+# (disease, specialization) pairs against the snapshot and only go to
+# MySQL for live slot availability.
+#
+# Refreshes are incremental: rows with updated_at at or past each table's
+# high-water mark are re-read and applied to a copy of the snapshot, which
+# then replaces the old one in a single assignment. Deleted rows are not
+# visible to updated_at, so the snapshot is also fully reloaded every
+# DIRECTORY_FULL_RELOAD_SECONDS. Tables without an updated_at column (see
+# setup_directory_tracking.py) are handled by full reloads only.
+
+DIRECTORY_ENABLED = os.environ.get("MEDIQUERY_DOCTOR_DIRECTORY", "1") == "1"
+DIRECTORY_REFRESH_SECONDS = float(os.environ.get("MEDIQUERY_DIRECTORY_REFRESH_SECONDS", 30))
+DIRECTORY_FULL_RELOAD_SECONDS = float(os.environ.get("MEDIQUERY_DIRECTORY_FULL_RELOAD_SECONDS", 3600))
+
+# table -> (selected columns, primary key columns, extra WHERE condition)
+DIRECTORY_TABLES = {
+    "hospital": (
+        "hospital_id, name AS hospital_name, location, latitude, longitude, rating AS hospital_rating",
+        ("hospital_id",), None
+    ),
+    "doctor": (
+        "doctor_id, name AS doctor_name, specialization, contact_no, hospital_id",
+        ("doctor_id",), None
+    ),
+    "doctor_disease_expertise": (
+        "doctor_id, disease_id, success_rate, total_cases",
+        ("doctor_id", "disease_id"), None
+    ),
+    "consultation_fees": (
+        "doctor_id, base_fee",
+        ("doctor_id",), "consultation_type = 'in-person'"
+    ),
+    "disease": (
+        "disease_id, name",
+        ("disease_id",), None
+    )
+}
+
+TRACKED_TABLES_QUERY = """
+SELECT table_name AS table_name FROM information_schema.columns
+WHERE table_schema = DATABASE() AND column_name = 'updated_at'
+AND table_name IN ({tables})
+"""
+
+class DoctorDirectory:
+    def __init__(self, tables, high_water_marks, tracked):
+        self.tables = tables
+        self.high_water_marks = high_water_marks
+        self.tracked = tracked
+        self.built_at = time.monotonic()
+
+        hospitals = tables["hospital"]
+        fees = tables["consultation_fees"]
+
+        self.disease_ids = {row["name"]: disease_id for (disease_id,), row in tables["disease"].items()}
+        self.expertise = {}
+        for (doctor_id, disease_id), row in tables["doctor_disease_expertise"].items():
+            self.expertise.setdefault(disease_id, {})[doctor_id] = (
+                row["success_rate"] or 0, row["total_cases"] or 0
+            )
+
+        # Joined doctor/hospital/fee rows per specialization, ordered by doctor_id
+        self.by_specialization = {}
+        for (doctor_id,) in sorted(tables["doctor"]):
+            doctor = tables["doctor"][(doctor_id,)]
+            hospital = hospitals.get((doctor["hospital_id"],))
+            if hospital is None:
+                continue
+            fee = fees.get((doctor_id,))
+            row = dict(doctor, **hospital)
+            row["base_fee"] = fee["base_fee"] if fee else None
+            self.by_specialization.setdefault(doctor["specialization"], []).append(row)
+
+    def __len__(self):
+        return len(self.tables["doctor"])
+
+    def lookup(self, pairs, hospital_distances=None):
+        """
+        Same result as doctor_lookup.fetch_doctors_for_matches:
+        {(disease, specialist): [doctor, ...]} with fresh row dicts. When
+        hospital_distances is given, only doctors at those hospitals are
+        returned, with distance_km set.
+        """
+        doctors_by_pair = {}
+        for disease_name, specialist in dict.fromkeys(pairs):
+            expertise = self.expertise.get(self.disease_ids.get(disease_name), {})
+            doctors = []
+            for row in self.by_specialization.get(specialist, ()):
+                if hospital_distances is not None:
+                    if row["hospital_id"] not in hospital_distances:
+                        continue
+                    row = dict(row, distance_km=hospital_distances[row["hospital_id"]])
+                success_rate, total_cases = expertise.get(row["doctor_id"], (0, 0))
+                doctors.append(dict(row, success_rate=success_rate, total_cases=total_cases))
+            doctors_by_pair[(disease_name, specialist)] = doctors
+        return doctors_by_pair
+
+    def apply(self, changes, high_water_marks):
+        """New snapshot with changed rows ({table: [row, ...]}) upserted"""
+        tables = dict(self.tables)
+        for table, rows in changes.items():
+            if not rows:
+                continue
+            keys = DIRECTORY_TABLES[table][1]
+            tables[table] = dict(tables[table])
+            for row in rows:
+                tables[table][tuple(row[key] for key in keys)] = row
+        return DoctorDirectory(tables, high_water_marks, self.tracked)
+
+    def stats(self):
+        return {
+            "doctors": len(self),
+            "hospitals": len(self.tables["hospital"]),
+            "specializations": len(self.by_specialization),
+            "age_seconds": round(time.monotonic() - self.built_at, 1),
+            "incremental": self.tracked == set(DIRECTORY_TABLES)
+        }
+
+def _read_table(cursor, table, tracked, since=None):
+    """Rows of a directory table (only those changed since the mark, if given) and the new mark"""
+    columns, _, condition = DIRECTORY_TABLES[table]
+    conditions = [condition] if condition else []
+    params = ()
+    if table in tracked:
+        columns += ", updated_at"
+        if since is not None:
+            conditions.append("updated_at >= %s")
+            params = (since,)
+
+    query = f"SELECT {columns} FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    cursor.execute(query, params)
+
+    rows = cursor.fetchall()
+    high_water_mark = since
+    for row in rows:
+        updated_at = row.pop("updated_at", None)
+        if updated_at is not None and (high_water_mark is None or updated_at > high_water_mark):
+            high_water_mark = updated_at
+    return rows, high_water_mark
+
+def load_doctor_directory(cursor):
+    """Full snapshot of the directory tables"""
+    cursor.execute(
+        TRACKED_TABLES_QUERY.format(tables=", ".join(["%s"] * len(DIRECTORY_TABLES))),
+        tuple(DIRECTORY_TABLES)
+    )
+    tracked = {row["table_name"] for row in cursor.fetchall()}
+
+    tables = {}
+    high_water_marks = {}
+    for table, (_, keys, _) in DIRECTORY_TABLES.items():
+        rows, high_water_mark = _read_table(cursor, table, tracked)
+        tables[table] = {tuple(row[key] for key in keys): row for row in rows}
+        high_water_marks[table] = high_water_mark
+    return DoctorDirectory(tables, high_water_marks, tracked)
+
+def refresh_doctor_directory(cursor, directory):
+    """Apply rows changed since the snapshot's high-water marks"""
+    if directory.tracked != set(DIRECTORY_TABLES):
+        return load_doctor_directory(cursor)
+
+    changes = {}
+    high_water_marks = {}
+    for table in DIRECTORY_TABLES:
+        changes[table], high_water_marks[table] = _read_table(
+            cursor, table, directory.tracked, directory.high_water_marks[table]
+        )
+    return directory.apply(changes, high_water_marks)
+
+_directory = None
+_directory_checked_at = 0.0
+_directory_loaded_at = 0.0
+_directory_lock = threading.Lock()
+
+def get_doctor_directory(cursor):
+    """Return the directory snapshot, refreshing it when the refresh interval has passed"""
+    global _directory, _directory_checked_at, _directory_loaded_at
+    now = time.monotonic()
+    if _directory is not None and now - _directory_checked_at < DIRECTORY_REFRESH_SECONDS:
+        return _directory
+
+    with _directory_lock:
+        now = time.monotonic()
+        if _directory is None or now - _directory_loaded_at > DIRECTORY_FULL_RELOAD_SECONDS:
+            directory = load_doctor_directory(cursor)
+            _directory_loaded_at = now
+            print(f"🩺 Doctor directory loaded: {len(directory)} doctors")
+        elif now - _directory_checked_at >= DIRECTORY_REFRESH_SECONDS:
+            directory = refresh_doctor_directory(cursor, _directory)
+        else:
+            return _directory
+        # Swap in the new snapshot in one assignment; readers keep the one they hold
+        _directory, _directory_checked_at = directory, now
+    return _directory
+
+def current_doctor_directory():
+    """The last loaded snapshot (None before the first load), without refreshing it"""
+    return _directory
+
+def get_directory_stats():
+    directory = _directory
+    if directory is None:
+        return {"doctors": 0, "enabled": DIRECTORY_ENABLED}
+    return dict(directory.stats(), enabled=DIRECTORY_ENABLED)
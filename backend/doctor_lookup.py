@@ -0,0 +1,578 @@
+import base64
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from db_config import mysql_connection
+from hospital_geo_index import HospitalGeoIndex, haversine_km
+from doctor_directory import DIRECTORY_ENABLED, get_doctor_directory
+from result_cache import ResultCache
+from field_selection import parse_fields, check_fields, project_row
+
+# ============================================
+# DOCTOR / SLOT LOOKUPS SHARED BY THE SEARCH ROUTES
+# ============================================
+
+# Where nearby doctors are filtered:
+# "memory" narrows the doctor query to hospitals found by the in-process
+#          HospitalGeoIndex (rebuilt every HOSPITAL_INDEX_REFRESH_SECONDS)
+# "mysql"  prefilters by bounding box and ST_Distance_Sphere on
+#          hospital.geo_point (run setup_hospital_geo.py once)
+# "python" fetches every doctor and filters by haversine distance
+GEO_FILTER = os.environ.get("MEDIQUERY_GEO_FILTER", "memory")
+HOSPITAL_INDEX_REFRESH_SECONDS = float(os.environ.get("MEDIQUERY_HOSPITAL_INDEX_REFRESH_SECONDS", 300))
+HOSPITAL_INDEX_CELL_KM = float(os.environ.get("MEDIQUERY_HOSPITAL_INDEX_CELL_KM", 10))
+
+# Doctors returned per disease, unless a request asks for a different page
+# size (capped at MAX_DOCTOR_PAGE_SIZE)
+DOCTOR_PAGE_SIZE = int(os.environ.get("MEDIQUERY_DOCTOR_PAGE_SIZE", 10))
+MAX_DOCTOR_PAGE_SIZE = int(os.environ.get("MEDIQUERY_MAX_DOCTOR_PAGE_SIZE", 50))
+
+# How doctors are ordered within a disease; doctors without a known
+# distance sort as if they were 999 km away. doctor_id comes last so every
+# key is unique, which keyset pagination relies on.
+RANKING_POLICIES = {
+    "distance": lambda doc: (doc.get("distance_km", 999), -doc.get("success_rate", 0), doc["doctor_id"]),
+    "success_rate": lambda doc: (-doc.get("success_rate", 0), doc.get("distance_km", 999), doc["doctor_id"])
+}
+DOCTOR_RANKING = os.environ.get("MEDIQUERY_DOCTOR_RANKING", "distance")
+
+# Threads shared by all requests for running per-disease work (ranking and
+# slot loading) concurrently; 1 runs it inline
+SEARCH_WORKERS = int(os.environ.get("MEDIQUERY_SEARCH_WORKERS", 4))
+
+KM_PER_DEGREE = 111.045
+
+_hospital_index = None
+_hospital_index_built_at = 0.0
+_hospital_index_lock = threading.Lock()
+
+_search_executor = None
+_search_executor_lock = threading.Lock()
+
+# Next free slots per doctor. Entries are keyed by (today, doctor_id) so a
+# list cached before midnight, the slot_date >= CURDATE() boundary, is never
+# served after it; booking and cancelling drop the doctor's entry at once.
+slot_cache = ResultCache(
+    max_entries=int(os.environ.get("MEDIQUERY_SLOT_CACHE_SIZE", 5000)),
+    ttl_seconds=float(os.environ.get("MEDIQUERY_SLOT_CACHE_TTL", 60))
+)
+SLOT_CACHE_WARM_SIZE = int(os.environ.get("MEDIQUERY_SLOT_CACHE_WARM_SIZE", 200))
+
+# How often each doctor's slots were requested, to pick doctors to warm
+_slot_requests = Counter()
+_slot_requests_lock = threading.Lock()
+
+# Doctors for several (disease, specialist) pairs at once. Each doctor is
+# returned once per requested disease it has expertise in (or once with a
+# NULL disease_name), so doctors shared by two diseases with the same
+# specialist are not fetched twice. The placeholders are filled in by
+# fetch_doctors_for_matches; rows for one doctor always stay adjacent.
+MULTI_DOCTOR_QUERY = """
+SELECT
+    d.doctor_id,
+    d.specialization,
+    h.hospital_id,
+    h.latitude,
+    h.longitude,{columns}
+    di.name AS disease_name,
+    dde.success_rate,
+    dde.total_cases{distance_column}
+FROM doctor d
+JOIN hospital h ON d.hospital_id = h.hospital_id
+LEFT JOIN doctor_disease_expertise dde
+    ON d.doctor_id = dde.doctor_id
+    AND dde.disease_id IN (SELECT disease_id FROM disease WHERE name IN ({diseases}))
+LEFT JOIN disease di ON di.disease_id = dde.disease_id{fee_join}
+WHERE d.specialization IN ({specializations}){geo_filter}{page_filter}
+ORDER BY {order_by}{limit}
+"""
+
+# Display-only columns of MULTI_DOCTOR_QUERY; a fields= selection leaves out
+# the ones not asked for (and the fee join with base_fee). The remaining
+# columns are always needed for ranking, grouping and distances.
+OPTIONAL_DOCTOR_COLUMNS = {
+    "doctor_name": "d.name AS doctor_name",
+    "contact_no": "d.contact_no",
+    "hospital_name": "h.name AS hospital_name",
+    "location": "h.location",
+    "hospital_rating": "h.rating AS hospital_rating",
+    "base_fee": "cf.base_fee"
+}
+
+FEE_JOIN = """
+LEFT JOIN consultation_fees cf
+    ON d.doctor_id = cf.doctor_id AND cf.consultation_type = 'in-person'"""
+
+# Everything a doctor entry in a search response can contain
+DOCTOR_FIELDS = {
+    "doctor_id", "specialization", "hospital_id", "latitude", "longitude",
+    "success_rate", "total_cases", "distance_km", "available_slots", *OPTIONAL_DOCTOR_COLUMNS
+}
+
+# Fragments that turn MULTI_DOCTOR_QUERY into a radius search. The bounding
+# box lets the spatial index discard far hospitals before the exact
+# great-circle distance is computed.
+NEARBY_DISTANCE_COLUMN = """,
+    ST_Distance_Sphere(h.geo_point, ST_SRID(POINT(%s, %s), 4326)) / 1000 AS distance_km"""
+
+NEARBY_FILTER = """
+AND MBRContains(ST_PolygonFromText(%s, 4326, 'axis-order=long-lat'), h.geo_point)
+AND ST_Distance_Sphere(h.geo_point, ST_SRID(POINT(%s, %s), 4326)) <= %s"""
+
+# Restricts MULTI_DOCTOR_QUERY to hospitals already known to be in range
+HOSPITAL_FILTER = """
+AND d.hospital_id IN ({hospitals})"""
+
+# The parts of the RANKING_POLICIES keys as SQL expressions, for reading one
+# page straight from MySQL. Distances are rounded the way
+# rank_doctors_by_distance rounds them, so both sides compare the same keys.
+ROUNDED_DISTANCE = "ROUND(ST_Distance_Sphere(h.geo_point, ST_SRID(POINT(%s, %s), 4326)) / 1000, 2)"
+HOSPITAL_DISTANCE = "CASE h.hospital_id {cases} END"
+UNKNOWN_DISTANCE = "999"
+SUCCESS_RATE = "COALESCE(dde.success_rate, 0)"
+
+# "Ranked after" for each policy, spelled out so it works without row
+# constructors over mixed ASC/DESC parts; filled in by keyset_clause
+KEYSET_FILTERS = {
+    "distance": """
+AND ({distance} > %s OR ({distance} = %s AND ({success_rate} < %s OR ({success_rate} = %s AND d.doctor_id > %s))))""",
+    "success_rate": """
+AND ({success_rate} < %s OR ({success_rate} = %s AND ({distance} > %s OR ({distance} = %s AND d.doctor_id > %s))))"""
+}
+KEYSET_ORDER = {
+    "distance": ("{distance}", "{success_rate} DESC", "d.doctor_id"),
+    "success_rate": ("{success_rate} DESC", "{distance}", "d.doctor_id")
+}
+
+# Next free slots for a set of doctors in one pass; the IN list is filled in
+# by fetch_slots_for_doctors and the last parameter is the per-doctor limit
+SLOTS_FOR_DOCTORS_QUERY = """
+SELECT slot_id, doctor_id, slot_date, slot_time
+FROM (
+    SELECT
+        slot_id, doctor_id, slot_date, slot_time,
+        ROW_NUMBER() OVER (PARTITION BY doctor_id ORDER BY slot_date, slot_time) AS slot_rank
+    FROM appointment_slots
+    WHERE doctor_id IN ({placeholders}) AND is_booked = FALSE
+    AND slot_date >= CURDATE()
+) ranked
+WHERE slot_rank <= %s
+ORDER BY doctor_id, slot_date, slot_time
+"""
+
+SLOTS_PER_DOCTOR = 5
+
+def refresh_hospital_geo_index(cursor):
+    """Rebuild the in-memory hospital geo index from the hospital table"""
+    global _hospital_index, _hospital_index_built_at
+    cursor.execute("SELECT hospital_id, latitude, longitude FROM hospital")
+    index = HospitalGeoIndex(cursor.fetchall(), cell_km=HOSPITAL_INDEX_CELL_KM)
+    _hospital_index, _hospital_index_built_at = index, time.monotonic()
+    print(f"🏥 Hospital geo index built: {len(index)} hospitals")
+    return index
+
+def get_hospital_geo_index(cursor):
+    """Return the hospital geo index, rebuilding it once it is older than the refresh interval"""
+    if _hospital_index is None or time.monotonic() - _hospital_index_built_at > HOSPITAL_INDEX_REFRESH_SECONDS:
+        with _hospital_index_lock:
+            if _hospital_index is None or time.monotonic() - _hospital_index_built_at > HOSPITAL_INDEX_REFRESH_SECONDS:
+                refresh_hospital_geo_index(cursor)
+    return _hospital_index
+
+def current_hospital_geo_index():
+    """The last built hospital geo index (None before the first build), without refreshing it"""
+    return _hospital_index
+
+def get_hospital_index_stats():
+    index = _hospital_index
+    return {
+        "hospitals": len(index) if index is not None else 0,
+        "age_seconds": round(time.monotonic() - _hospital_index_built_at, 1) if index is not None else None,
+        "refresh_seconds": HOSPITAL_INDEX_REFRESH_SECONDS
+    }
+
+def bounding_box_wkt(lat, lng, radius_km):
+    """WKT polygon (longitude latitude) enclosing a radius_km circle around a point"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    # Longitude degrees are narrowest at the box edge closest to a pole
+    edge_lat = min(abs(lat) + lat_delta, 89.0)
+    lng_delta = radius_km / (KM_PER_DEGREE * math.cos(math.radians(edge_lat)))
+    south, north = max(lat - lat_delta, -90.0), min(lat + lat_delta, 90.0)
+    west, east = max(lng - lng_delta, -180.0), min(lng + lng_delta, 180.0)
+    return (
+        f"POLYGON(({west} {south}, {east} {south}, {east} {north}, "
+        f"{west} {north}, {west} {south}))"
+    )
+
+def keyset_clause(ranking, after, distance, distance_params):
+    """
+    (WHERE fragment, ORDER BY, fragment parameters, ORDER BY parameters)
+    selecting doctors ranked after the key after under a ranking policy.
+    distance is the SQL for the distance part of the key.
+    """
+    ranking = ranking or DOCTOR_RANKING
+    expressions = {"distance": distance, "success_rate": SUCCESS_RATE}
+    # A bare number in ORDER BY would name a column position, so the
+    # constant distance of searches without a location is left out there
+    order_by = ", ".join(
+        part.format(**expressions) for part in KEYSET_ORDER[ranking]
+        if not (part == "{distance}" and distance == UNKNOWN_DISTANCE)
+    )
+    if after is None:
+        return "", order_by, (), distance_params
+    if ranking == "success_rate":
+        rate, distance_after, doctor_id = -after[0], after[1], after[2]
+        params = (rate, rate, *distance_params, distance_after, *distance_params, distance_after, doctor_id)
+    else:
+        distance_after, rate, doctor_id = after[0], -after[1], after[2]
+        params = (*distance_params, distance_after, *distance_params, distance_after, rate, rate, doctor_id)
+    return KEYSET_FILTERS[ranking].format(**expressions), order_by, params, distance_params
+
+def doctor_query(pairs, near=None, hospital_distances=None, fields=None, page=None):
+    """
+    MULTI_DOCTOR_QUERY and its parameters for (disease, specialist) pairs.
+    hospital_distances limits it to those hospitals; near with
+    GEO_FILTER="mysql" turns it into a radius search ordered by distance.
+    fields limits the display columns to those selected.
+
+    page=(ranking, after, limit), for a single pair, returns at most limit
+    doctors ranked after the key after, in ranking order. Distances are
+    only known in SQL with GEO_FILTER "mysql" or hospital_distances, so
+    near with GEO_FILTER "python" cannot be paged here.
+    """
+    diseases = list(dict.fromkeys(disease for disease, _ in pairs))
+    specializations = list(dict.fromkeys(specialist for _, specialist in pairs))
+    columns = [field for field in OPTIONAL_DOCTOR_COLUMNS if fields is None or field in fields]
+    placeholders = {
+        "diseases": ", ".join(["%s"] * len(diseases)),
+        "specializations": ", ".join(["%s"] * len(specializations)),
+        "columns": "".join(f"\n    {OPTIONAL_DOCTOR_COLUMNS[field]}," for field in columns),
+        "fee_join": FEE_JOIN if "base_fee" in columns else ""
+    }
+
+    if near and GEO_FILTER == "mysql":
+        lat, lng, radius_km = float(near[0]), float(near[1]), float(near[2])
+        distance_column, geo_filter, order_by = NEARBY_DISTANCE_COLUMN, NEARBY_FILTER, "distance_km, d.doctor_id"
+        column_params, filter_params = (lng, lat), (bounding_box_wkt(lat, lng, radius_km), lng, lat, radius_km * 1000)
+        distance, distance_params = ROUNDED_DISTANCE, (lng, lat)
+    elif hospital_distances is not None:
+        distance_column, order_by = "", "d.doctor_id"
+        geo_filter = HOSPITAL_FILTER.format(hospitals=", ".join(["%s"] * len(hospital_distances)))
+        column_params, filter_params = (), tuple(hospital_distances)
+        distance = HOSPITAL_DISTANCE.format(cases=" ".join(["WHEN %s THEN %s"] * len(hospital_distances)))
+        distance_params = tuple(
+            value for hospital_id, distance_km in hospital_distances.items()
+            for value in (hospital_id, round(distance_km, 2))
+        )
+    else:
+        distance_column, geo_filter, order_by = "", "", "d.doctor_id"
+        column_params, filter_params = (), ()
+        distance, distance_params = UNKNOWN_DISTANCE, ()
+
+    page_filter, limit, page_params = "", "", ()
+    if page is not None:
+        ranking, after, page_limit = page
+        page_filter, order_by, filter_page_params, order_params = keyset_clause(ranking, after, distance, distance_params)
+        limit = "\nLIMIT %s"
+        page_params = (*filter_page_params, *order_params, page_limit)
+
+    query = MULTI_DOCTOR_QUERY.format(
+        distance_column=distance_column, geo_filter=geo_filter, page_filter=page_filter,
+        order_by=order_by, limit=limit, **placeholders
+    )
+    params = (*column_params, *diseases, *specializations, *filter_params, *page_params)
+    return query, params
+
+def group_doctor_rows(rows, pairs, hospital_distances=None):
+    """
+    Fan MULTI_DOCTOR_QUERY rows out to {(disease, specialist): [doctor, ...]}.
+    Each pair gets its own row dicts (success rate depends on the disease),
+    built from one shared doctor/hospital row per doctor.
+    """
+    # Rows come ordered so repeats of a doctor are adjacent
+    doctors_by_specialization = {specialist: [] for _, specialist in pairs}
+    expertise = {}
+    for row in rows:
+        disease_name = row.pop("disease_name")
+        success_rate = row.pop("success_rate")
+        total_cases = row.pop("total_cases")
+        specialists = doctors_by_specialization[row["specialization"]]
+        if not specialists or specialists[-1]["doctor_id"] != row["doctor_id"]:
+            if hospital_distances is not None:
+                row["distance_km"] = hospital_distances[row["hospital_id"]]
+            specialists.append(row)
+        if disease_name is not None:
+            expertise[(row["doctor_id"], disease_name)] = (success_rate or 0, total_cases or 0)
+
+    doctors_by_pair = {}
+    for disease_name, specialist in pairs:
+        doctors_by_pair[(disease_name, specialist)] = [
+            dict(doctor, success_rate=success_rate, total_cases=total_cases)
+            for doctor in doctors_by_specialization[specialist]
+            for success_rate, total_cases in [expertise.get((doctor["doctor_id"], disease_name), (0, 0))]
+        ]
+    return doctors_by_pair
+
+def fetch_doctors_for_matches(cursor, pairs, near=None, fields=None, page=None):
+    """
+    Doctors for every (disease, specialist) pair with a single query, as
+    {(disease, specialist): [doctor, ...]}.
+
+    With near=(lat, lng, max_distance_km) and GEO_FILTER "memory" or
+    "mysql", only doctors within the radius are returned, with
+    distance_km already set.
+
+    Served from the in-process doctor directory snapshot when it is
+    enabled, unless the radius search has to run in MySQL. Only there
+    does fields (a DOCTOR_FIELDS selection) narrow the rows; callers
+    project the response rows themselves.
+
+    page=(ranking, after, limit) for a single pair asks only for the
+    doctors ranked after the key after. When the query runs in MySQL the
+    keyset condition and limit run there, so a later page does not read
+    the whole specialty; callers still cut the page with page_doctors.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+
+    hospital_distances = None
+    if near and GEO_FILTER == "memory":
+        hospital_distances = get_hospital_geo_index(cursor).within(
+            float(near[0]), float(near[1]), float(near[2])
+        )
+        if not hospital_distances:
+            return {pair: [] for pair in pairs}
+
+    if DIRECTORY_ENABLED and not (near and GEO_FILTER == "mysql"):
+        return get_doctor_directory(cursor).lookup(pairs, hospital_distances)
+
+    if near and GEO_FILTER == "python":
+        # Distances are only computed after the fetch, so the page is cut in Python
+        page = None
+    query, params = doctor_query(pairs, near, hospital_distances, fields, page)
+    cursor.execute(query, params)
+    return group_doctor_rows(cursor.fetchall(), pairs, hospital_distances)
+
+def resolve_page_size(requested=None):
+    """Page size from a request value, falling back to DOCTOR_PAGE_SIZE and capped at the maximum"""
+    try:
+        page_size = int(requested) if requested is not None else DOCTOR_PAGE_SIZE
+    except (TypeError, ValueError):
+        page_size = DOCTOR_PAGE_SIZE
+    return max(1, min(page_size, MAX_DOCTOR_PAGE_SIZE))
+
+def resolve_ranking(requested=None):
+    """Ranking policy name from a request value, falling back to DOCTOR_RANKING"""
+    return requested if requested in RANKING_POLICIES else DOCTOR_RANKING
+
+def resolve_doctor_fields(requested):
+    """A validated fields= selection for doctor rows, or None for all fields"""
+    fields = parse_fields(requested)
+    if fields is not None:
+        check_fields(fields, DOCTOR_FIELDS)
+    return fields
+
+def select_doctor_fields(doctors, fields):
+    """Doctor rows narrowed to a fields= selection; doctor_id is always kept"""
+    if fields is None:
+        return doctors
+    return [project_row(doc, fields, always=("doctor_id",)) for doc in doctors]
+
+def rank_doctors_by_distance(doctors, user_lat, user_lng, max_distance, limit=None, ranking=None, after=None):
+    """
+    Drop doctors beyond max_distance and order the rest by the ranking
+    policy (DOCTOR_RANKING by default). With limit, only the best limit
+    doctors are selected, without sorting the whole list. With after (a
+    ranking key), only doctors ranked after it are considered.
+    """
+    if user_lat and user_lng:
+        # Radius lookups already set distance_km; the rest are computed in one vectorized call
+        missing = [doc for doc in doctors if doc.get("distance_km") is None]
+        computed = iter(haversine_km(
+            float(user_lat), float(user_lng),
+            [float(doc["latitude"]) for doc in missing],
+            [float(doc["longitude"]) for doc in missing]
+        ))
+
+        doctors_with_distance = []
+        for doc in doctors:
+            distance = doc.get("distance_km")
+            if distance is None:
+                distance = float(next(computed))
+
+            if distance <= max_distance:
+                doc["distance_km"] = round(distance, 2)
+                doctors_with_distance.append(doc)
+    else:
+        doctors_with_distance = list(doctors)
+
+    sort_key = RANKING_POLICIES[ranking or DOCTOR_RANKING]
+    if after is not None:
+        doctors_with_distance = [doc for doc in doctors_with_distance if sort_key(doc) > after]
+    if limit is not None:
+        return heapq.nsmallest(limit, doctors_with_distance, key=sort_key)
+    doctors_with_distance.sort(key=sort_key)
+    return doctors_with_distance
+
+def page_doctors(doctors, user_lat, user_lng, max_distance, page_size, ranking=None, after=None):
+    """
+    One page of ranked doctors and the ranking key to continue after, or
+    None when this is the last page
+    """
+    ranked = rank_doctors_by_distance(
+        doctors, user_lat, user_lng, max_distance,
+        limit=page_size + 1, ranking=ranking, after=after
+    )
+    page = ranked[:page_size]
+    if len(ranked) > page_size:
+        return page, RANKING_POLICIES[ranking or DOCTOR_RANKING](page[-1])
+    return page, None
+
+# Ranking keys mix floats, Decimals and ints; they are tagged in the cursor
+# so they come back as the same types and compare exactly
+_KEY_TYPES = {"f": float, "d": Decimal, "i": int}
+
+def encode_page_cursor(state, after):
+    """Opaque continuation token for the page following the ranking key after"""
+    key = [
+        ["d", str(part)] if isinstance(part, Decimal)
+        else ["i", part] if isinstance(part, int)
+        else ["f", repr(float(part))]
+        for part in after
+    ]
+    payload = json.dumps(dict(state, after=key), separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_page_cursor(token):
+    """(state, after) from encode_page_cursor; raises ValueError on a malformed token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        after = tuple(_KEY_TYPES[kind](value) for kind, value in state.pop("after"))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    return state, after
+
+def slots_query(doctor_ids, per_doctor=SLOTS_PER_DOCTOR):
+    """SLOTS_FOR_DOCTORS_QUERY and its parameters for a list of doctors"""
+    query = SLOTS_FOR_DOCTORS_QUERY.format(placeholders=", ".join(["%s"] * len(doctor_ids)))
+    return query, (*doctor_ids, per_doctor)
+
+def group_slot_rows(rows, doctor_ids):
+    """SLOTS_FOR_DOCTORS_QUERY rows as {doctor_id: [slot, ...]} formatted for JSON"""
+    slots_by_doctor = {doctor_id: [] for doctor_id in doctor_ids}
+    for slot in rows:
+        slots_by_doctor[slot["doctor_id"]].append({
+            "slot_id": slot["slot_id"],
+            "slot_date": slot["slot_date"].isoformat(),
+            "slot_time": str(slot["slot_time"])
+        })
+    return slots_by_doctor
+
+def fetch_slots_for_doctors(cursor, doctor_ids, per_doctor=SLOTS_PER_DOCTOR):
+    """Next free slots for every doctor in doctor_ids with a single query"""
+    doctor_ids = list(dict.fromkeys(doctor_ids))
+    if not doctor_ids:
+        return {}
+
+    cursor.execute(*slots_query(doctor_ids, per_doctor))
+    return group_slot_rows(cursor.fetchall(), doctor_ids)
+
+def cached_slots(doctor_ids):
+    """Split doctor_ids into ({doctor_id: cached slots}, [uncached doctor_id, ...])"""
+    today = date.today()
+    slots_by_doctor = {}
+    missing = []
+    for doctor_id in dict.fromkeys(doctor_ids):
+        slots = slot_cache.get((today, doctor_id))
+        if slots is None:
+            missing.append(doctor_id)
+        else:
+            slots_by_doctor[doctor_id] = slots
+    return slots_by_doctor, missing
+
+def cache_slots(slots_by_doctor):
+    today = date.today()
+    for doctor_id, slots in slots_by_doctor.items():
+        slot_cache.put((today, doctor_id), slots)
+
+def cached_slots_for_doctors(cursor, doctor_ids):
+    """
+    Like fetch_slots_for_doctors, but only queries doctors missing from the
+    slot cache. With cursor=None a pooled connection is borrowed for them.
+    """
+    slots_by_doctor, missing = cached_slots(doctor_ids)
+
+    if missing:
+        if cursor is None:
+            with mysql_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                fetched = fetch_slots_for_doctors(cursor, missing)
+                cursor.close()
+        else:
+            fetched = fetch_slots_for_doctors(cursor, missing)
+        cache_slots(fetched)
+        slots_by_doctor.update(fetched)
+    return slots_by_doctor
+
+def count_slot_requests(doctor_ids):
+    """Track how often doctors' slots are requested, for warm_slot_cache"""
+    with _slot_requests_lock:
+        _slot_requests.update(set(doctor_ids))
+
+def attach_slots(cursor, doctors):
+    """
+    Attach free slots to all listed doctors, querying only the uncached
+    ones. With cursor=None a pooled connection is borrowed, and only if
+    some doctor is not cached.
+    """
+    doctor_ids = [doc["doctor_id"] for doc in doctors]
+    count_slot_requests(doctor_ids)
+
+    # Cached slot lists are shared between responses, so they are never mutated
+    slots_by_doctor = cached_slots_for_doctors(cursor, doctor_ids)
+    for doc in doctors:
+        doc["available_slots"] = slots_by_doctor[doc["doctor_id"]]
+
+def map_concurrently(func, items):
+    """
+    list(map(func, items)) with the calls spread over the shared search
+    thread pool. Results keep the order of items.
+    """
+    global _search_executor
+    items = list(items)
+    if SEARCH_WORKERS <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    if _search_executor is None:
+        with _search_executor_lock:
+            if _search_executor is None:
+                _search_executor = ThreadPoolExecutor(
+                    max_workers=SEARCH_WORKERS, thread_name_prefix="search-fanout"
+                )
+    return list(_search_executor.map(func, items))
+
+def invalidate_doctor_slots(doctor_id):
+    """Forget a doctor's cached slots after one of them was booked or released"""
+    slot_cache.invalidate((date.today(), doctor_id))
+
+def warm_slot_cache(cursor, doctor_ids=None, limit=SLOT_CACHE_WARM_SIZE):
+    """
+    Load slots for doctor_ids (by default the most requested doctors) into
+    the cache with one query. Returns the number of doctors warmed.
+    """
+    if doctor_ids is None:
+        with _slot_requests_lock:
+            doctor_ids = [doctor_id for doctor_id, _ in _slot_requests.most_common(limit)]
+
+    fetched = fetch_slots_for_doctors(cursor, doctor_ids)
+    cache_slots(fetched)
+    return len(fetched)
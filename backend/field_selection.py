@@ -0,0 +1,54 @@
+import re
+
+# ============================================
+# FIELD SELECTION (?fields=)
+# ============================================
+# Clients can ask for a subset of fields, e.g. a slim prescription list
+# with ?fields=filename,upload_date,ocr_data.doctor_name, and fetch heavy
+# fields such as ocr_data.raw_text only on drill-down. The selection is
+# pushed into the MongoDB projection or SQL select list where possible and
+# applied to the response rows otherwise.
+
+_FIELD_PART = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def parse_fields(value):
+    """Requested fields from "a,b.c" or ["a", "b.c"]; None when not given"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        raise ValueError("fields must be a comma-separated string or a list")
+    fields = list(dict.fromkeys(str(field).strip() for field in value if str(field).strip()))
+    return fields or None
+
+def check_fields(fields, allowed, nested=()):
+    """
+    Raise ValueError for fields outside allowed. Fields listed in nested
+    also accept any sub-field ("ocr_data.doctor_name").
+    """
+    unknown = []
+    for field in fields:
+        top, _, rest = field.partition(".")
+        if rest:
+            if top not in nested or not all(_FIELD_PART.match(part) for part in rest.split(".")):
+                unknown.append(field)
+        elif top not in allowed:
+            unknown.append(field)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+def mongo_projection(fields, default):
+    """MongoDB projection for the selected fields (default when none were selected)"""
+    if not fields:
+        return default
+    # A parent path already returns its children; listing both is an error in MongoDB
+    kept = [field for field in fields
+            if not any(field.startswith(other + ".") for other in fields if other != field)]
+    projection = {"_id": 1}
+    projection.update({field: 1 for field in kept})
+    return projection
+
+def project_row(row, fields, always=()):
+    """Copy of a flat row with only the selected (and always-kept) keys"""
+    return {key: row[key] for key in (*always, *fields) if key in row}
@@ -0,0 +1,118 @@
+import atexit
+import queue
+import threading
+import time
+
+# ============================================
+# WRITE-BEHIND SEARCH HISTORY LOGGER
+# ============================================
+# Request handlers hand history documents to a bounded queue and return
+# immediately; a background thread writes them with insert_many once a
+# batch fills up or the flush interval passes. Whatever is still queued
+# is flushed when the process exits.
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "block")
+
+class HistoryLogger:
+    def __init__(self, collection, batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, overflow_policy="drop_newest", block_timeout=0.5):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {OVERFLOW_POLICIES}")
+
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+
+        self._worker = threading.Thread(target=self._run, name="history-logger", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def log(self, record):
+        """Queue one history document. Returns False if it was dropped."""
+        if self._closed.is_set():
+            self._write([record])
+            return True
+
+        try:
+            if self.overflow_policy == "block":
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow_policy != "drop_oldest":
+                self.stats["dropped"] += 1
+                return False
+            # Make room by discarding the oldest queued record
+            try:
+                self._queue.get_nowait()
+                self.stats["dropped"] += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.stats["dropped"] += 1
+                return False
+
+        self.stats["queued"] += 1
+        return True
+
+    def log_many(self, records):
+        for record in records:
+            self.log(record)
+
+    def flush(self):
+        """Write everything currently queued"""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._worker.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self._flush_lock:
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                self.stats["written"] += len(batch)
+            except Exception as e:
+                self.stats["failed"] += len(batch)
+                print(f"❌ History write failed ({len(batch)} records): {str(e)}")
+
+    def _run(self):
+        while not self._closed.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            while len(batch) < self.batch_size and not self._closed.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
@@ -0,0 +1,120 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, distances fall back to plain Python
+    np = None
+
+# ============================================
+# IN-MEMORY HOSPITAL GEO INDEX
+# ============================================
+# Hospitals are bucketed into a lat/lng grid. A radius query only looks at
+# the cells overlapping the circle's bounding box, and computes great-circle
+# distances for those candidates in one vectorized haversine call.
+# k-nearest queries grow the search radius until k hospitals are found.
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+def haversine_km(lat, lng, latitudes, longitudes):
+    """Distances in km from one point to arrays of points (degrees)"""
+    if np is None:
+        return [_haversine_scalar(lat, lng, la, lo) for la, lo in zip(latitudes, longitudes)]
+
+    lat1 = math.radians(lat)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(longitudes, dtype=np.float64) - lng)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def _haversine_scalar(lat1, lng1, lat2, lng2):
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dlng / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+class HospitalGeoIndex:
+    def __init__(self, hospitals, cell_km=10):
+        """hospitals: rows with hospital_id, latitude and longitude"""
+        self.cell_degrees = cell_km / KM_PER_DEGREE
+        self.hospital_ids = []
+        self.latitudes = []
+        self.longitudes = []
+        self.cells = {}
+
+        for hospital in hospitals:
+            if hospital["latitude"] is None or hospital["longitude"] is None:
+                continue
+            lat, lng = float(hospital["latitude"]), float(hospital["longitude"])
+            self.cells.setdefault(self._cell(lat, lng), []).append(len(self.hospital_ids))
+            self.hospital_ids.append(hospital["hospital_id"])
+            self.latitudes.append(lat)
+            self.longitudes.append(lng)
+
+        if np is not None:
+            self.latitudes = np.array(self.latitudes, dtype=np.float64)
+            self.longitudes = np.array(self.longitudes, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.hospital_ids)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def _candidates(self, lat, lng, radius_km):
+        """Positions of hospitals in grid cells overlapping the radius' bounding box"""
+        lat_delta = radius_km / KM_PER_DEGREE
+        # Longitude degrees are narrowest at the box edge closest to a pole
+        edge_lat = abs(lat) + lat_delta
+        if edge_lat >= 90:
+            return list(range(len(self.hospital_ids)))
+        lng_delta = radius_km / (KM_PER_DEGREE * math.cos(math.radians(edge_lat)))
+        south, west = self._cell(lat - lat_delta, lng - lng_delta)
+        north, east = self._cell(lat + lat_delta, lng + lng_delta)
+
+        # A huge radius covers more cells than there are hospitals
+        if (north - south + 1) * (east - west + 1) >= len(self.cells):
+            return list(range(len(self.hospital_ids)))
+
+        positions = []
+        for row in range(south, north + 1):
+            for col in range(west, east + 1):
+                positions.extend(self.cells.get((row, col), ()))
+        return positions
+
+    def _distances(self, lat, lng, positions):
+        if np is not None:
+            positions = np.asarray(positions, dtype=np.intp)
+            return positions, haversine_km(lat, lng, self.latitudes[positions], self.longitudes[positions])
+        return positions, haversine_km(
+            lat, lng,
+            [self.latitudes[p] for p in positions],
+            [self.longitudes[p] for p in positions]
+        )
+
+    def within(self, lat, lng, radius_km):
+        """{hospital_id: distance_km} for hospitals within radius_km of a point"""
+        positions, distances = self._distances(lat, lng, self._candidates(lat, lng, radius_km))
+        return {
+            self.hospital_ids[int(position)]: float(distance)
+            for position, distance in zip(positions, distances)
+            if distance <= radius_km
+        }
+
+    def nearest(self, lat, lng, k):
+        """The k nearest hospitals as [(hospital_id, distance_km)], nearest first"""
+        if k <= 0 or not self.hospital_ids:
+            return []
+        k = min(k, len(self.hospital_ids))
+
+        radius_km = self.cell_degrees * KM_PER_DEGREE
+        while True:
+            found = self.within(lat, lng, radius_km)
+            # Everything inside the radius is final once k hospitals are in it;
+            # a radius past the whole globe always contains every hospital
+            if len(found) >= k or radius_km > math.pi * EARTH_RADIUS_KM:
+                return sorted(found.items(), key=lambda item: (item[1], item[0]))[:k]
+            radius_km *= 2
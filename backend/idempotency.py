@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import Response, current_app, jsonify, request
+from pymongo.errors import DuplicateKeyError
+
+from serializers import dumps_bytes
+
+# ============================================
+# IDEMPOTENT REQUESTS
+# ============================================
+# A request carrying an Idempotency-Key header claims that key (the _id of
+# a document in idempotency_keys) before it runs. Its response is stored
+# under the key, and a retry with the same key gets the stored response
+# back without running the route again.
+#
+# Without the header, a key is derived from the request's identifying
+# fields and kept for IMPLICIT_WINDOW_SECONDS. That catches double-clicked
+# submissions from clients that do not send keys.
+#
+# A key whose request is still running answers 409. Its claim lapses after
+# IDEMPOTENCY_LOCK_SECONDS, so a crashed request does not block retries
+# forever. 5xx responses are not stored, so the key can be retried. Stored
+# keys expire through a TTL index on expires_at.
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("MEDIQUERY_IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("MEDIQUERY_IDEMPOTENCY_LOCK_SECONDS", 30))
+IMPLICIT_WINDOW_SECONDS = int(os.environ.get("MEDIQUERY_IMPLICIT_IDEMPOTENCY_SECONDS", 10))
+MAX_KEY_LENGTH = 255
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def idempotency_claim(scope, header_key, body, implicit_fields=()):
+    """(key_id, fingerprint, ttl_seconds) for a request, or None if it has no key"""
+    if header_key:
+        return f"{scope}:{header_key}", _digest(body), IDEMPOTENCY_TTL_SECONDS
+    if implicit_fields:
+        identity = _digest({field: body.get(field) for field in implicit_fields})
+        return f"{scope}:implicit:{identity}", identity, IMPLICIT_WINDOW_SECONDS
+    return None
+
+def invalid_key(header_key):
+    return header_key is not None and not 0 < len(header_key) <= MAX_KEY_LENGTH
+
+def _claim_fields(fingerprint, ttl, now):
+    return {
+        "fingerprint": fingerprint,
+        "status": "in_progress",
+        "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        "expires_at": now + timedelta(seconds=ttl)
+    }
+
+def _takeover_filter(key_id, now):
+    # Claims left by crashed requests, and stored keys the TTL monitor has not removed yet
+    return {"_id": key_id, "$or": [
+        {"status": "in_progress", "locked_until": {"$lt": now}},
+        {"expires_at": {"$lt": now}}
+    ]}
+
+def _completion(status_code, body, ttl, now):
+    return {"$set": {
+        "status": "done",
+        "status_code": status_code,
+        "body": body,
+        "expires_at": now + timedelta(seconds=ttl)
+    }, "$unset": {"locked_until": ""}}
+
+def _error_body(message):
+    # Same bytes jsonify would produce
+    return (dumps_bytes({"error": message}) + b"\n").decode("utf-8")
+
+def stored_outcome(existing, fingerprint):
+    """(status_code, json_body, replayed) to answer a request whose key is already taken"""
+    if existing.get("fingerprint") != fingerprint:
+        return 422, _error_body("Idempotency-Key was already used for a different request"), False
+    if existing.get("status") != "done":
+        return 409, _error_body("This request is already being processed"), False
+    return existing["status_code"], existing["body"], True
+
+class IdempotencyStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        # Returns the driver's result, so a motor collection's can be awaited
+        return self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def claim(self, key_id, fingerprint, ttl):
+        """None if this request now owns the key, else the document holding it"""
+        now = datetime.now(timezone.utc)
+        try:
+            self.collection.insert_one({"_id": key_id, **_claim_fields(fingerprint, ttl, now)})
+            return None
+        except DuplicateKeyError:
+            pass
+        if self.collection.find_one_and_update(_takeover_filter(key_id, now), {"$set": _claim_fields(fingerprint, ttl, now)}):
+            return None
+        return self.collection.find_one({"_id": key_id}) or {"fingerprint": fingerprint}
+
+    def complete(self, key_id, status_code, body, ttl):
+        self.collection.update_one({"_id": key_id}, _completion(status_code, body, ttl, datetime.now(timezone.utc)))
+
+    def release(self, key_id):
+        self.collection.delete_one({"_id": key_id, "status": "in_progress"})
+
+class AsyncIdempotencyStore(IdempotencyStore):
+    """IdempotencyStore over a motor collection"""
+
+    async def claim(self, key_id, fingerprint, ttl):
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_one({"_id": key_id, **_claim_fields(fingerprint, ttl, now)})
+            return None
+        except DuplicateKeyError:
+            pass
+        if await self.collection.find_one_and_update(_takeover_filter(key_id, now), {"$set": _claim_fields(fingerprint, ttl, now)}):
+            return None
+        return await self.collection.find_one({"_id": key_id}) or {"fingerprint": fingerprint}
+
+    async def complete(self, key_id, status_code, body, ttl):
+        await self.collection.update_one({"_id": key_id}, _completion(status_code, body, ttl, datetime.now(timezone.utc)))
+
+    async def release(self, key_id):
+        await self.collection.delete_one({"_id": key_id, "status": "in_progress"})
+
+def idempotent(store, scope, implicit_fields=()):
+    """Make a JSON POST route idempotent under the Idempotency-Key header"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            header_key = request.headers.get("Idempotency-Key")
+            if invalid_key(header_key):
+                return jsonify({"error": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"}), 400
+
+            claim = idempotency_claim(scope, header_key, request.get_json(silent=True) or {}, implicit_fields)
+            if claim is None:
+                return view(*args, **kwargs)
+            key_id, fingerprint, ttl = claim
+
+            existing = store.claim(key_id, fingerprint, ttl)
+            if existing is not None:
+                status_code, body, replayed = stored_outcome(existing, fingerprint)
+                response = Response(body, status=status_code, mimetype="application/json")
+                if replayed:
+                    response.headers["Idempotent-Replayed"] = "true"
+                return response
+
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                store.release(key_id)
+                raise
+            if response.status_code >= 500 or response.is_streamed:
+                store.release(key_id)
+            else:
+                store.complete(key_id, response.status_code, response.get_data(as_text=True), ttl)
+            return response
+        return wrapper
+    return decorator
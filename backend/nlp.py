@@ -1,151 +1,397 @@
 from pymongo import MongoClient
 from datetime import datetime
+import heapq
+import os
 import re
+import threading
+import time
+from symptom_index import SymptomIndex
+from spell_index import load_word_list
+from symptom_matrix import SymptomMatrix, np
+from catalogue_versions import MEDICAL_KNOWLEDGE, FOLLOWUP_QUESTIONS, get_catalogue_versions
+from history_logger import HistoryLogger
+from result_cache import ResultCache
+
+# "index" scores through the inverted index, "numpy" through the
+# vectorized disease x symptom matrix (requires numpy)
+SCORING_ENGINE = os.environ.get("MEDIQUERY_SCORING_ENGINE", "index")
+
+# Typo tolerance: largest spelling correction (0 disables it), shortest
+# token that gets corrected, tokens shorter than FUZZY_SHORT_TOKEN_LENGTH
+# are corrected by one edit at most, and weight lost per corrected character
+FUZZY_MAX_EDIT_DISTANCE = int(os.environ.get("MEDIQUERY_FUZZY_MAX_EDIT_DISTANCE", 2))
+FUZZY_MIN_TOKEN_LENGTH = int(os.environ.get("MEDIQUERY_FUZZY_MIN_TOKEN_LENGTH", 5))
+FUZZY_SHORT_TOKEN_LENGTH = int(os.environ.get("MEDIQUERY_FUZZY_SHORT_TOKEN_LENGTH", 9))
+FUZZY_PENALTY = float(os.environ.get("MEDIQUERY_FUZZY_PENALTY", 0.15))
+
+# Words that are never corrected (one per line, or a SymSpell frequency dictionary)
+FUZZY_DICTIONARY = os.environ.get(
+    "MEDIQUERY_FUZZY_DICTIONARY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "common_words.txt")
+)
+
+# Number of disease matches returned per analysis
+TOP_K = 3
+
+# Seconds between checks of the catalogue version stamps
+VERSION_CHECK_INTERVAL = 30
+
+EMERGENCY_KEYWORDS = ["severe", "acute", "unbearable", "emergency", "urgent", "bleeding", "unconscious"]
 
 client = MongoClient("mongodb://localhost:27017/")
 db = client["mediquery_nlp"]
 
+# Search history is written behind the request in batches
+search_history = HistoryLogger(
+    db["user_search_history"],
+    batch_size=int(os.environ.get("MEDIQUERY_HISTORY_BATCH_SIZE", 100)),
+    flush_interval=float(os.environ.get("MEDIQUERY_HISTORY_FLUSH_SECONDS", 1.0)),
+    max_queue_size=int(os.environ.get("MEDIQUERY_HISTORY_QUEUE_SIZE", 10000)),
+    overflow_policy=os.environ.get("MEDIQUERY_HISTORY_OVERFLOW", "drop_newest")
+)
+
+# Memoized analyses keyed by the canonical symptom set, emergency flag and
+# follow-up answers; cleared whenever a catalogue is reloaded
+diagnosis_cache = ResultCache(
+    max_entries=int(os.environ.get("MEDIQUERY_DIAGNOSIS_CACHE_SIZE", 1024)),
+    ttl_seconds=float(os.environ.get("MEDIQUERY_DIAGNOSIS_CACHE_TTL", 300))
+)
+
+# Compiled symptom index (built at startup, rebuilt via refresh_symptom_index)
+_symptom_index = None
+_scoring_engine = None
+_catalogue_lock = threading.Lock()
+
+# Follow-up catalogue: disease -> questions, question text -> [(disease, question)]
+_followup_catalogue = None
+_followup_by_question = None
+
+# Catalogue versions the in-memory copies were built from, and a counter
+# bumped on every reload so cached results from older catalogues never match
+_loaded_versions = {}
+_catalogue_generation = 0
+_last_version_check = 0.0
+
 def clean_text(text):
     text = text.lower()
     text = re.sub(r'[^a-z\s]', '', text)
     return text.split()
 
-def get_followup_questions(disease_name):
-    """Fetch follow-up questions for a disease"""
-    print(f"🔍 Searching follow-up questions for: '{disease_name}'")
-    disease_data = db["disease_followup_questions"].find_one({"disease": disease_name})
-    
-    if disease_data:
-        questions = disease_data.get("follow_up_questions", [])
-        print(f"✅ Found {len(questions)} questions for {disease_name}")
-        return questions
-    else:
-        print(f"❌ No follow-up data found for: '{disease_name}'")
-        return []
+def load_known_words():
+    """Words from FUZZY_DICTIONARY; without them any long enough word can be 'corrected'"""
+    try:
+        return load_word_list(FUZZY_DICTIONARY)
+    except OSError as e:
+        print(f"⚠️ Could not load the spelling dictionary: {e}")
+        return set()
 
-def analyze_symptoms_advanced(user_input, follow_up_answers=None):
-    """
-    Multi-stage symptom analysis with proper follow-up integration
-    """
+def refresh_symptom_index():
+    """Rebuild the in-memory symptom index from medical_knowledge"""
+    global _symptom_index, _scoring_engine, _catalogue_generation
+    version = get_catalogue_versions(db, [MEDICAL_KNOWLEDGE])[MEDICAL_KNOWLEDGE]
+    index = SymptomIndex(
+        list(db["medical_knowledge"].find()), EMERGENCY_KEYWORDS,
+        max_edit_distance=FUZZY_MAX_EDIT_DISTANCE,
+        min_correction_length=FUZZY_MIN_TOKEN_LENGTH,
+        correction_penalty=FUZZY_PENALTY,
+        short_token_length=FUZZY_SHORT_TOKEN_LENGTH,
+        known_words=load_known_words()
+    )
     
-    print(f"\n{'='*60}")
-    print(f"🔍 ANALYZING SYMPTOMS: '{user_input}'")
-    if follow_up_answers:
-        print(f"📋 Follow-up answers provided: {follow_up_answers}")
-    print(f"{'='*60}")
+    engine = index
+    if SCORING_ENGINE == "numpy":
+        if np is not None:
+            engine = SymptomMatrix(index)
+        else:
+            print("⚠️ numpy not installed, falling back to the index scoring engine")
     
-    # Clean and tokenize
-    user_words = clean_text(user_input)
-    print(f"📝 Tokenized words: {user_words}")
+    # Swap in the new index in one assignment so requests never see a partial build
+    _symptom_index, _scoring_engine = index, engine
+    _loaded_versions[MEDICAL_KNOWLEDGE] = version
+    _catalogue_generation += 1
+    diagnosis_cache.clear()
+    print(f"📚 Symptom index built: {len(index)} diseases, {len(index.postings)} symptoms ({type(engine).__name__})")
+    return index
+
+def get_symptom_index():
+    """Return the symptom index, building it on first use"""
+    if _symptom_index is None:
+        with _catalogue_lock:
+            if _symptom_index is None:
+                refresh_symptom_index()
+    return _symptom_index
+
+def get_scoring_engine():
+    """Return the configured scoring engine (SymptomIndex or SymptomMatrix)"""
+    check_catalogue_versions()
+    get_symptom_index()
+    get_followup_catalogue()
+    return _scoring_engine
+
+def refresh_followup_catalogue():
+    """Reload the follow-up question catalogue from disease_followup_questions"""
+    global _followup_catalogue, _followup_by_question, _catalogue_generation
+    version = get_catalogue_versions(db, [FOLLOWUP_QUESTIONS])[FOLLOWUP_QUESTIONS]
     
-    # Check for emergency keywords
-    emergency_keywords = ["severe", "acute", "unbearable", "emergency", "urgent", "bleeding", "unconscious"]
-    is_emergency = any(keyword in user_input.lower() for keyword in emergency_keywords)
+    catalogue = {}
+    for disease_data in db["disease_followup_questions"].find():
+        # First document wins, same as find_one on the disease name
+        catalogue.setdefault(disease_data["disease"], disease_data.get("follow_up_questions", []))
     
-    # Get all disease documents
-    diseases = list(db["medical_knowledge"].find())
-    print(f"📚 Total diseases in database: {len(diseases)}")
+    by_question = {}
+    for disease_name, questions in catalogue.items():
+        for fq in questions:
+            by_question.setdefault(fq["question"], []).append((disease_name, fq))
     
-    # Calculate matching scores
-    disease_scores = []
+    _followup_catalogue, _followup_by_question = catalogue, by_question
+    _loaded_versions[FOLLOWUP_QUESTIONS] = version
+    _catalogue_generation += 1
+    diagnosis_cache.clear()
+    print(f"📋 Follow-up catalogue loaded: {len(catalogue)} diseases")
+    return catalogue
+
+def get_followup_catalogue():
+    """Return the follow-up catalogue, loading it on first use"""
+    if _followup_catalogue is None:
+        with _catalogue_lock:
+            if _followup_catalogue is None:
+                refresh_followup_catalogue()
+    return _followup_catalogue
+
+def check_catalogue_versions(force=False):
+    """Reload in-memory catalogues whose version stamp has changed"""
+    global _last_version_check
+    now = time.monotonic()
+    if not force and now - _last_version_check < VERSION_CHECK_INTERVAL:
+        return
+    _last_version_check = now
+    
+    versions = get_catalogue_versions(db, [MEDICAL_KNOWLEDGE, FOLLOWUP_QUESTIONS])
+    if _symptom_index is not None and versions[MEDICAL_KNOWLEDGE] != _loaded_versions.get(MEDICAL_KNOWLEDGE):
+        refresh_symptom_index()
+    if _followup_catalogue is not None and versions[FOLLOWUP_QUESTIONS] != _loaded_versions.get(FOLLOWUP_QUESTIONS):
+        refresh_followup_catalogue()
+
+def get_cache_stats():
+    """Hit/miss counters of the diagnosis cache"""
+    return diagnosis_cache.stats()
+
+def _cache_key(terms, is_emergency, follow_up_answers):
+    answers = ()
+    if follow_up_answers:
+        answers = tuple(sorted((str(q), str(a)) for q, a in follow_up_answers.items()))
+    return (_catalogue_generation, frozenset(terms.items()), is_emergency, answers)
+
+def get_followup_questions(disease_name):
+    """Follow-up questions for a disease from the in-memory catalogue"""
+    return get_followup_catalogue().get(disease_name, [])
+
+def _followup_candidates(engine, follow_up_answers):
+    """Positions of diseases that have at least one of the answered questions"""
+    get_followup_catalogue()
+    answered = {
+        disease_name
+        for question_text in follow_up_answers
+        for disease_name, _ in _followup_by_question.get(question_text, ())
+    }
+    return {pos for disease_name in answered for pos in engine.positions.get(disease_name, ())}
+
+def _score_followups(disease, follow_up_answers, total_possible_weight):
+    """Follow-up score, confirmations and updated max possible weight for one disease"""
+    followup_score = 0
+    followup_matched = []
     
-    for disease in diseases:
-        initial_score = 0
-        matched_symptoms = []
-        total_possible_weight = 0
+    for fq in get_followup_questions(disease["disease"]):
+        question_text = fq["question"]
+        answer = follow_up_answers.get(question_text)
         
-        # STEP 1: Match original symptoms from user input
-        for symptom in disease.get("symptoms", []):
-            symptom_name = symptom["name"]
-            weight = symptom.get("weight", 0.5)
-            total_possible_weight += weight
-            
-            if symptom_name in user_words:
-                initial_score += weight
-                matched_symptoms.append(symptom_name)
+        # Check if answer is "yes" or matches an option
+        if answer:
+            if fq["type"] == "yes_no" and answer.lower() == "yes":
+                followup_score += fq["weight"]
+                followup_matched.append(fq["symptom_mapped"])
+                total_possible_weight += fq["weight"]
+            elif fq["type"] == "multiple_choice":
+                # For multiple choice, any non-empty answer adds weight
+                followup_score += fq["weight"]
+                followup_matched.append(f"{fq['symptom_mapped']}:{answer}")
+                total_possible_weight += fq["weight"]
+    
+    return followup_score, followup_matched, total_possible_weight
+
+def _rank_diseases(engine, is_emergency, terms, follow_up_answers, top_k=TOP_K):
+    """Combine initial and follow-up scores and return the top k matches"""
+    
+    if follow_up_answers:
+        initial_matches = engine.match(terms)
         
-        # STEP 2: Add follow-up answer scores (THIS WAS MISSING!)
-        followup_score = 0
-        followup_matched = []
+        # Follow-up answers can lift diseases with no initial match, so add
+        # every disease that owns one of the answered questions
+        candidates = set(initial_matches) | _followup_candidates(engine, follow_up_answers)
         
-        if follow_up_answers:
-            followup_questions = get_followup_questions(disease["disease"])
+        scored = []
+        for disease_pos in candidates:
+            initial_score, matched_symptoms = initial_matches.get(disease_pos, (0, []))
+            
+            # STEP 2: Add follow-up answer scores
+            followup_score, followup_matched, total_possible_weight = _score_followups(
+                engine.diseases[disease_pos], follow_up_answers, engine.max_weights[disease_pos]
+            )
             
-            for fq in followup_questions:
-                question_text = fq["question"]
-                answer = follow_up_answers.get(question_text)
-                
-                # Check if answer is "yes" or matches an option
-                if answer:
-                    if fq["type"] == "yes_no" and answer.lower() == "yes":
-                        followup_score += fq["weight"]
-                        followup_matched.append(fq["symptom_mapped"])
-                        total_possible_weight += fq["weight"]
-                    elif fq["type"] == "multiple_choice":
-                        # For multiple choice, any non-empty answer adds weight
-                        followup_score += fq["weight"]
-                        followup_matched.append(f"{fq['symptom_mapped']}:{answer}")
-                        total_possible_weight += fq["weight"]
+            # STEP 3: Calculate final score, only keep diseases with some match
+            total_score = initial_score + followup_score
+            if total_score <= 0:
+                continue
+            
+            # STEP 4: Calculate confidence (normalize by total possible weight)
+            if total_possible_weight > 0:
+                confidence = min(total_score / total_possible_weight, 1.0)
+            else:
+                confidence = 0.0
+            
+            scored.append((confidence, disease_pos, initial_score, matched_symptoms,
+                           followup_score, followup_matched, total_possible_weight))
         
-        # STEP 3: Calculate final score
+        ranked = heapq.nsmallest(top_k, scored, key=lambda x: (-x[0], x[1]))
+    else:
+        # Without follow-ups the engine can prune diseases that cannot reach the top k
+        ranked = _without_followups(engine, engine.top_k(terms, top_k))
+    
+    return _build_results(engine, is_emergency, ranked, follow_up_answers)
+
+def _without_followups(engine, top):
+    """Widen the engine's (confidence, position, score, symptoms) tuples with empty follow-up fields"""
+    return [
+        (confidence, disease_pos, initial_score, matched_symptoms, 0, [], engine.max_weights[disease_pos])
+        for confidence, disease_pos, initial_score, matched_symptoms in top
+    ]
+
+def _build_results(engine, is_emergency, ranked, follow_up_answers):
+    """Result dicts for the ranked matches; follow-up questions are only fetched for these"""
+    disease_scores = []
+    for (confidence, disease_pos, initial_score, matched_symptoms,
+         followup_score, followup_matched, total_possible_weight) in ranked:
+        disease = engine.diseases[disease_pos]
         total_score = initial_score + followup_score
         
-        # STEP 4: Calculate confidence (normalize by total possible weight)
-        if total_possible_weight > 0:
-            confidence = min(total_score / total_possible_weight, 1.0)
-        else:
-            confidence = 0.0
+        # Get follow-up questions ONLY if no follow-up answers were provided yet
+        followup_qs = [] if follow_up_answers else get_followup_questions(disease["disease"])
         
-        # Only include diseases with some match
-        if total_score > 0:
-            # Get follow-up questions ONLY if no follow-up answers were provided yet
-            followup_qs = [] if follow_up_answers else get_followup_questions(disease["disease"])
-            
-            print(f"\n✨ MATCH FOUND: {disease['disease']}")
-            print(f"   Initial score: {initial_score:.2f}")
-            print(f"   Follow-up score: {followup_score:.2f}")
-            print(f"   Total score: {total_score:.2f}/{total_possible_weight:.2f}")
-            print(f"   Confidence: {confidence:.2%}")
-            print(f"   Initial symptoms: {matched_symptoms}")
-            if followup_matched:
-                print(f"   ✅ Follow-up confirmations: {followup_matched}")
-            
-            all_matched = matched_symptoms + followup_matched
-            
-            disease_scores.append({
-                "disease": disease["disease"],
-                "confidence": confidence,
-                "matched_symptoms": all_matched,
-                "specialist": disease["specialist_requirements"]["primary"],
-                "requires_urgent_care": is_emergency or disease["specialist_requirements"].get("urgent_care_eligible", False),
-                "follow_up_questions": followup_qs,
-                "score_breakdown": {
-                    "initial_score": initial_score,
-                    "followup_score": followup_score,
-                    "total_score": total_score,
-                    "max_possible": total_possible_weight
-                }
-            })
-    
-    # Sort by confidence
-    disease_scores.sort(key=lambda x: x["confidence"], reverse=True)
+        print(f"\n✨ MATCH FOUND: {disease['disease']}")
+        print(f"   Initial score: {initial_score:.2f}")
+        print(f"   Follow-up score: {followup_score:.2f}")
+        print(f"   Total score: {total_score:.2f}/{total_possible_weight:.2f}")
+        print(f"   Confidence: {confidence:.2%}")
+        print(f"   Initial symptoms: {matched_symptoms}")
+        if followup_matched:
+            print(f"   ✅ Follow-up confirmations: {followup_matched}")
+        
+        disease_scores.append({
+            "disease": disease["disease"],
+            "confidence": confidence,
+            "matched_symptoms": matched_symptoms + followup_matched,
+            "specialist": disease["specialist_requirements"]["primary"],
+            "requires_urgent_care": is_emergency or disease["specialist_requirements"].get("urgent_care_eligible", False),
+            "follow_up_questions": followup_qs,
+            "score_breakdown": {
+                "initial_score": initial_score,
+                "followup_score": followup_score,
+                "total_score": total_score,
+                "max_possible": total_possible_weight
+            }
+        })
     
     print(f"\n{'='*60}")
-    print(f"FINAL RESULTS: {len(disease_scores)} matches")
+    print(f"FINAL RESULTS: top {len(disease_scores)} matches")
     if disease_scores:
         print(f"Top match: {disease_scores[0]['disease']} ({disease_scores[0]['confidence']:.1%})")
     print(f"{'='*60}")
     
-    # Store to user_search_history
+    return disease_scores
+
+def _history_record(user_input, follow_up_answers, matches, is_emergency):
+    """Build the user_search_history document for one analysis"""
     action_type = "refined_symptom_search" if follow_up_answers else "symptom_search"
     
-    db["user_search_history"].insert_one({
+    return {
         "action": action_type,
         "timestamp": datetime.now(),
         "input": user_input,
         "follow_up_answers": follow_up_answers,
-        "results": disease_scores[:3],
+        "results": matches,
         "emergency_detected": is_emergency
-    })
+    }
+
+def analyze_symptoms_advanced(user_input, follow_up_answers=None, log_history=True):
+    """
+    Multi-stage symptom analysis with proper follow-up integration
+    """
+    
+    print(f"\n{'='*60}")
+    print(f"🔍 ANALYZING SYMPTOMS: '{user_input}'")
+    if follow_up_answers:
+        print(f"📋 Follow-up answers provided: {follow_up_answers}")
+    print(f"{'='*60}")
+    
+    # Clean and tokenize
+    user_words = clean_text(user_input)
+    print(f"📝 Tokenized words: {user_words}")
+    
+    # STEP 1: Find symptom phrases and emergency keywords in one pass,
+    # then match them via the scoring engine
+    engine = get_scoring_engine()
+    print(f"📚 Total diseases in database: {len(engine)}")
+    terms, emergency_triggers = engine.scan(user_words)
+    print(f"🔎 Symptom phrases found: {sorted(terms.items())}")
+    is_emergency = bool(emergency_triggers)
+    
+    # Same symptoms in any order or spelling of punctuation give the same analysis
+    cache_key = _cache_key(terms, is_emergency, follow_up_answers)
+    top_matches = diagnosis_cache.get(cache_key)
+    if top_matches is not None:
+        print(f"⚡ Diagnosis cache hit: {len(top_matches)} matches")
+    else:
+        top_matches = _rank_diseases(engine, is_emergency, terms, follow_up_answers)
+        diagnosis_cache.put(cache_key, top_matches)
+    # Callers get their own dicts so they can't alter the cached entry
+    top_matches = [dict(match) for match in top_matches]
+    
+    # Store to user_search_history
+    if log_history:
+        search_history.log(_history_record(user_input, follow_up_answers, top_matches, is_emergency))
+    
+    return top_matches
+
+def analyze_symptoms_batch(user_inputs):
+    """
+    Analyze several symptom descriptions in one pass.
+    Scores every input with a single engine call and queues all history
+    records together. Returns one match list per input.
+    """
+    
+    print(f"\n{'='*60}")
+    print(f"🔍 ANALYZING BATCH OF {len(user_inputs)} SYMPTOM QUERIES")
+    print(f"{'='*60}")
+    
+    engine = get_scoring_engine()
+    scans = [engine.scan(clean_text(user_input)) for user_input in user_inputs]
+    cache_keys = [_cache_key(terms, bool(emergency_triggers), None) for terms, emergency_triggers in scans]
+    
+    # Only queries missing from the diagnosis cache go through the engine
+    cached = [diagnosis_cache.get(key) for key in cache_keys]
+    misses = [i for i, matches in enumerate(cached) if matches is None]
+    ranked_batch = engine.top_k_batch([scans[i][0] for i in misses], TOP_K)
+    for i, ranked in zip(misses, ranked_batch):
+        cached[i] = _build_results(engine, bool(scans[i][1]), _without_followups(engine, ranked), None)
+        diagnosis_cache.put(cache_keys[i], cached[i])
+    
+    results = []
+    history_records = []
+    for user_input, (_, emergency_triggers), matches in zip(user_inputs, scans, cached):
+        is_emergency = bool(emergency_triggers)
+        top_matches = [dict(match) for match in matches]
+        results.append(top_matches)
+        history_records.append(_history_record(user_input, None, top_matches, is_emergency))
+    
+    search_history.log_many(history_records)
     
-    return disease_scores[:3]
\ No newline at end of file
+    return results
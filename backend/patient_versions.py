@@ -0,0 +1,99 @@
+import secrets
+from datetime import datetime, timezone
+from flask import current_app, request
+
+# ============================================
+# PATIENT VERSION STAMPS
+# ============================================
+# One document per patient ({_id: patient_id, appointments: n,
+# prescriptions: n, epoch, updated_at}). Bookings and cancellations bump
+# "appointments", uploads bump "prescriptions". The patient read endpoints
+# derive their ETag from the stamps, so a matching If-None-Match is
+# answered with 304 after a single lookup by _id.
+#
+# Writers bump after their write and readers take the stamp before their
+# query, so a response is never tagged newer than the data it contains.
+# The epoch is set when a stamp document is created; tags issued before the
+# collection was reset can never match again.
+
+VERSIONS_COLLECTION = "patient_versions"
+
+APPOINTMENTS = "appointments"
+PRESCRIPTIONS = "prescriptions"
+
+def bump_patient_version(db, patient_id, scope):
+    """Mark a patient's appointments or prescriptions as changed (awaitable with motor)"""
+    return db[VERSIONS_COLLECTION].update_one(
+        {"_id": int(patient_id)},
+        {
+            "$inc": {scope: 1},
+            "$set": {"updated_at": datetime.now(timezone.utc)},
+            "$setOnInsert": {"epoch": secrets.token_hex(4)}
+        },
+        upsert=True
+    )
+
+# Bumps run after a write that already succeeded, so a failed bump is
+# retried and then logged; it never turns that write into an error. Until
+# the next bump, readers may answer 304 for data that changed.
+BUMP_ATTEMPTS = 2
+
+def record_patient_change(db, patient_id, scope):
+    """bump_patient_version after a successful write; True if the stamp moved"""
+    for attempt in range(1, BUMP_ATTEMPTS + 1):
+        try:
+            bump_patient_version(db, patient_id, scope)
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not bump {scope} version of patient {patient_id} (attempt {attempt}): {e}")
+    return False
+
+async def record_patient_change_async(db, patient_id, scope):
+    """record_patient_change for a motor database"""
+    for attempt in range(1, BUMP_ATTEMPTS + 1):
+        try:
+            await bump_patient_version(db, patient_id, scope)
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not bump {scope} version of patient {patient_id} (attempt {attempt}): {e}")
+    return False
+
+def get_patient_version(db, patient_id):
+    """A patient's stamp document ({} if never stamped)"""
+    return db[VERSIONS_COLLECTION].find_one({"_id": int(patient_id)}) or {}
+
+def patient_etag(stamp, scopes):
+    """ETag value for a response built from the given scopes"""
+    counters = "-".join(str(stamp.get(scope, 0)) for scope in scopes)
+    return f"{stamp.get('epoch', '0')}-{counters}"
+
+def patient_last_modified(stamp):
+    updated_at = stamp.get("updated_at")
+    if updated_at is not None and updated_at.tzinfo is None:
+        # MongoDB hands back naive UTC datetimes
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return updated_at
+
+def conditional_patient_response(db, patient_id, scopes, build_response):
+    """
+    build_response() tagged with the patient's version stamp, or an empty
+    304 when the request shows the client already holds that version. Tags
+    are weak because the body may be compressed.
+    """
+    stamp = get_patient_version(db, patient_id)
+    etag = patient_etag(stamp, scopes)
+    last_modified = patient_last_modified(stamp)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = bool(last_modified and since and last_modified.replace(microsecond=0) <= since)
+
+    response = current_app.response_class(status=304) if not_modified else build_response()
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Browsers keep the body but revalidate on every use
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,77 @@
+from collections import deque
+
+# ============================================
+# AHO-CORASICK PHRASE MATCHER
+# ============================================
+# Compiles a set of phrases into one automaton so every occurrence of
+# every phrase is found in a single left-to-right pass over the text.
+
+class PhraseMatcher:
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._built = False
+
+    def add(self, phrase, value, whole_words=True):
+        """
+        Register a phrase. whole_words=True only reports matches that start
+        and end on word boundaries; False reports any substring occurrence.
+        """
+        if not phrase:
+            return
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append((len(phrase), value, whole_words))
+        self._built = False
+
+    def build(self):
+        """Compute failure links (breadth-first) and merge outputs along them"""
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+        self._built = True
+        return self
+
+    def find(self, text):
+        """Yield (start, end, value) for every phrase occurrence in text"""
+        if not self._built:
+            self.build()
+
+        goto, fail, output = self._goto, self._fail, self._output
+        length = len(text)
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for phrase_length, value, whole_words in output[state]:
+                end = i + 1
+                start = end - phrase_length
+                if whole_words and not (
+                    (start == 0 or text[start - 1] == " ") and
+                    (end == length or text[end] == " ")
+                ):
+                    continue
+                yield start, end, value
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file
 from pymongo import MongoClient
 from datetime import datetime, timedelta
 from bson import ObjectId
@@ -6,11 +6,26 @@ import gridfs
 import io
 import secrets
 import hashlib
+import heapq
 from ocr_processor import process_prescription_file
+from serializers import stream_json_list
+from field_selection import parse_fields, check_fields, mongo_projection
+from patient_versions import APPOINTMENTS, PRESCRIPTIONS, record_patient_change, conditional_patient_response
 
 # Create Blueprint
 prescription_bp = Blueprint('prescription', __name__)
 
+# Top-level prescription fields a ?fields= selection may name; ocr_data
+# sub-fields (ocr_data.doctor_name, ocr_data.raw_text, ...) are allowed too
+PRESCRIPTION_FIELDS = {"patient_id", "file_id", "filename", "upload_date", "ocr_data", "type"}
+
+def prescription_fields():
+    """Validated ?fields= selection for prescription documents, or None"""
+    fields = parse_fields(request.args.get("fields"))
+    if fields is not None:
+        check_fields(fields, PRESCRIPTION_FIELDS, nested={"ocr_data"})
+    return fields
+
 # MongoDB setup
 mongo_client = MongoClient("mongodb://localhost:27017/")
 mongo_db = mongo_client["mediquery_nlp"]
@@ -68,6 +83,7 @@ def upload_prescription():
         }
         
         result = mongo_db["patient_prescriptions"].insert_one(prescription_record)
+        record_patient_change(mongo_db, patient_id, PRESCRIPTIONS)
         
         return jsonify({
             "success": True,
@@ -85,18 +101,28 @@ def upload_prescription():
 # ============================================
 @prescription_bp.route("/prescriptions/<int:patient_id>", methods=["GET"])
 def get_prescriptions(patient_id):
-    """Get all prescriptions for a patient"""
+    """Get all prescriptions for a patient (?fields= narrows each document)"""
+    try:
+        fields = prescription_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    prescriptions = list(mongo_db["patient_prescriptions"].find(
+    return conditional_patient_response(
+        mongo_db, patient_id, [PRESCRIPTIONS], lambda: prescriptions_response(patient_id, fields)
+    )
+
+def prescriptions_response(patient_id, fields=None):
+    prescriptions = mongo_db["patient_prescriptions"].find(
         {"patient_id": patient_id},
-        {"_id": 1, "filename": 1, "upload_date": 1, "ocr_data": 1}
-    ).sort("upload_date", -1))
+        mongo_projection(fields, {"_id": 1, "filename": 1, "upload_date": 1, "ocr_data": 1})
+    ).sort("upload_date", -1)
     
-    # Convert ObjectId to string
-    for presc in prescriptions:
-        presc["prescription_id"] = str(presc.pop("_id"))
+    def as_prescription(presc):
+        presc["prescription_id"] = presc.pop("_id")
+        return presc
     
-    return jsonify({"prescriptions": prescriptions})
+    # Streamed straight from the cursor; OCR data makes these documents large
+    return Response(stream_json_list("prescriptions", prescriptions, as_prescription), mimetype="application/json")
 
 # ============================================
 # GET MEDICAL HISTORY TIMELINE
@@ -106,53 +132,49 @@ def get_medical_timeline(patient_id):
     """
     Combine prescriptions + appointments into chronological timeline
     """
-    
-    # Get prescriptions
-    prescriptions = list(mongo_db["patient_prescriptions"].find(
+    return conditional_patient_response(
+        mongo_db, patient_id, [PRESCRIPTIONS, APPOINTMENTS], lambda: medical_timeline_response(patient_id)
+    )
+
+def medical_timeline_response(patient_id):
+    # Both sources come sorted most recent first, so the timeline is a merge
+    prescriptions = mongo_db["patient_prescriptions"].find(
         {"patient_id": patient_id},
         {"_id": 1, "filename": 1, "upload_date": 1, "ocr_data": 1}
-    ))
+    ).sort("upload_date", -1)
     
     # Get appointments (bookings)
-    appointments = list(mongo_db["user_search_history"].find(
+    appointments = mongo_db["user_search_history"].find(
         {"patient_id": patient_id, "type": "booking"},
         {"_id": 1, "doctor_name": 1, "hospital_name": 1, 
          "appointment_date": 1, "appointment_time": 1, 
          "specialization": 1, "booking_timestamp": 1, "status": 1}
-    ))
-    
-    # Create unified timeline
-    timeline = []
-    
-    # Add prescriptions
-    for presc in prescriptions:
-        timeline.append({
-            "type": "prescription",
-            "id": str(presc["_id"]),
-            "date": presc["upload_date"],
-            "title": f"Prescription uploaded: {presc['filename']}",
-            "doctor": presc["ocr_data"].get("doctor_name", "Unknown"),
-            "hospital": presc["ocr_data"].get("hospital", "N/A"),
-            "medicines_count": len(presc["ocr_data"].get("medicines", []))
-        })
-    
-    # Add appointments
-    for apt in appointments:
-        timeline.append({
-            "type": "appointment",
-            "id": str(apt["_id"]),
-            "date": apt["booking_timestamp"],
-            "title": f"Appointment with Dr. {apt['doctor_name']}",
-            "doctor": apt["doctor_name"],
-            "hospital": apt["hospital_name"],
-            "specialization": apt["specialization"],
-            "status": apt.get("status", "confirmed")
-        })
-    
-    # Sort by date (most recent first)
-    timeline.sort(key=lambda x: x["date"], reverse=True)
-    
-    return jsonify({"timeline": timeline})
+    ).sort("booking_timestamp", -1)
+    
+    prescription_entries = ({
+        "type": "prescription",
+        "id": presc["_id"],
+        "date": presc["upload_date"],
+        "title": f"Prescription uploaded: {presc['filename']}",
+        "doctor": presc["ocr_data"].get("doctor_name", "Unknown"),
+        "hospital": presc["ocr_data"].get("hospital", "N/A"),
+        "medicines_count": len(presc["ocr_data"].get("medicines", []))
+    } for presc in prescriptions)
+    
+    appointment_entries = ({
+        "type": "appointment",
+        "id": apt["_id"],
+        "date": apt["booking_timestamp"],
+        "title": f"Appointment with Dr. {apt['doctor_name']}",
+        "doctor": apt["doctor_name"],
+        "hospital": apt["hospital_name"],
+        "specialization": apt["specialization"],
+        "status": apt.get("status", "confirmed")
+    } for apt in appointments)
+    
+    # Most recent first, encoded as the merge produces entries
+    timeline = heapq.merge(prescription_entries, appointment_entries, key=lambda x: x["date"], reverse=True)
+    return Response(stream_json_list("timeline", timeline), mimetype="application/json")
 
 # ============================================
 # DOWNLOAD PRESCRIPTION FILE
@@ -269,6 +291,11 @@ def view_shared_records(token):
     data = request.get_json()
     password = data.get("password", None)
     
+    try:
+        fields = prescription_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     # Find share record
     share = mongo_db["shared_records"].find_one({
         "token": token,
@@ -301,13 +328,10 @@ def view_shared_records(token):
     patient_id = share["patient_id"]
     
     prescriptions = list(mongo_db["patient_prescriptions"].find(
-        {"patient_id": patient_id}
+        {"patient_id": patient_id},
+        mongo_projection(fields, None)
     ).sort("upload_date", -1))
     
-    for presc in prescriptions:
-        presc["_id"] = str(presc["_id"])
-        presc["file_id"] = str(presc["file_id"])
-    
     return jsonify({
         "success": True,
         "patient_id": patient_id,
@@ -0,0 +1,102 @@
+import dataclasses
+import json
+import os
+import uuid
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional dependency, falls back to the stdlib encoder
+    orjson = None
+
+# ============================================
+# JSON SERIALIZATION
+# ============================================
+# One encoder for every response. Besides plain JSON types it renders
+# MySQL and MongoDB values directly, so routes can return rows and
+# documents without converting them field by field:
+#
+#   Decimal            -> string ("500.00"), as Flask always did
+#   date / datetime    -> HTTP date, as Flask always did
+#   time / timedelta   -> "HH:MM:SS" (MySQL TIME columns arrive as timedelta)
+#   ObjectId, UUID     -> string
+#
+# With orjson installed (and MEDIQUERY_JSON_BACKEND not "json") encoding
+# runs in orjson; anything orjson rejects falls back to the stdlib encoder,
+# so the output never depends on which backend is active.
+
+JSON_BACKEND = os.environ.get("MEDIQUERY_JSON_BACKEND", "orjson" if orjson else "json")
+if JSON_BACKEND == "orjson" and orjson is None:
+    print("⚠️ orjson not installed, using the stdlib JSON encoder")
+    JSON_BACKEND = "json"
+
+# Streamed responses are flushed in chunks of about this many bytes
+STREAM_CHUNK_BYTES = int(os.environ.get("MEDIQUERY_JSON_STREAM_CHUNK_BYTES", 64 * 1024))
+
+def to_jsonable(value):
+    """JSON-compatible form of a value the encoders do not know"""
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (Decimal, ObjectId, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (time, timedelta)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+if orjson is not None:
+    # Dates go through to_jsonable to keep Flask's HTTP date format
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def dumps_bytes(value, indent=False):
+    """Encode a value as UTF-8 JSON bytes with sorted keys"""
+    if JSON_BACKEND == "orjson":
+        try:
+            return orjson.dumps(value, default=to_jsonable,
+                                option=ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+        except TypeError:
+            pass
+    return json.dumps(
+        value, default=to_jsonable, sort_keys=True,
+        indent=2 if indent else None, separators=None if indent else (",", ":")
+    ).encode("utf-8")
+
+def stream_json_list(key, items, transform=None):
+    """
+    Encode {key: [item, ...]} incrementally, yielding byte chunks. items can
+    be any iterable (e.g. a MongoDB cursor), so the full list is never held
+    in memory or encoded as one string.
+    """
+    buffer = bytearray(b'{"' + key.encode("utf-8") + b'":[')
+    first = True
+    for item in items:
+        if transform is not None:
+            item = transform(item)
+        if not first:
+            buffer += b","
+        buffer += dumps_bytes(item)
+        first = False
+        if len(buffer) >= STREAM_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]}\n"
+    yield bytes(buffer)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by dumps_bytes (used by jsonify)"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj, indent=bool(kwargs.get("indent"))).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,33 @@
+# Adds updated_at columns to the doctor directory tables so the in-process
+# directory snapshot (doctor_directory.py) can refresh incrementally
+from db_config import get_mysql_connection
+from doctor_directory import DIRECTORY_TABLES
+
+ADD_UPDATED_AT = """
+ALTER TABLE {table}
+    ADD COLUMN updated_at TIMESTAMP NOT NULL
+        DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    ADD INDEX idx_{table}_updated_at (updated_at)
+"""
+
+def setup_directory_tracking():
+    conn = get_mysql_connection()
+    cursor = conn.cursor()
+
+    for table in DIRECTORY_TABLES:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = 'updated_at'
+        """, (table,))
+        if cursor.fetchone()[0]:
+            print(f"✅ {table}.updated_at already exists")
+            continue
+        cursor.execute(ADD_UPDATED_AT.format(table=table))
+        conn.commit()
+        print(f"✅ Added {table}.updated_at")
+
+    cursor.close()
+    conn.close()
+
+if __name__ == "__main__":
+    setup_directory_tracking()
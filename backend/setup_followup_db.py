@@ -1,6 +1,7 @@
 # Create a new file: setup_followup_db.py
 from pymongo import MongoClient
 from datetime import datetime
+from catalogue_versions import FOLLOWUP_QUESTIONS, bump_catalogue_version
 
 client = MongoClient("mongodb://localhost:27017/")
 db = client["mediquery_nlp"]
@@ -240,6 +241,9 @@ def setup_followup_database():
     # Create index for faster queries
     db["disease_followup_questions"].create_index("disease")
     
+    # Let running API servers know the catalogue changed
+    bump_catalogue_version(db, FOLLOWUP_QUESTIONS)
+    
     print("✅ Database setup complete!")
 
 if __name__ == "__main__":
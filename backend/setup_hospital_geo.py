@@ -0,0 +1,34 @@
+# Adds a spatial POINT column and index to the hospital table so nearby
+# doctors can be filtered inside MySQL (see doctor_lookup.GEO_FILTER)
+from db_config import get_mysql_connection
+
+# geo_point is generated from latitude/longitude, so it never drifts from
+# them. POINT(x, y) is (longitude, latitude); SRID 4326 makes
+# ST_Distance_Sphere return metres and lets MBRContains use the index.
+ADD_GEO_COLUMN = """
+ALTER TABLE hospital
+    ADD COLUMN geo_point POINT
+        AS (ST_SRID(POINT(longitude, latitude), 4326)) STORED NOT NULL SRID 4326,
+    ADD SPATIAL INDEX idx_hospital_geo_point (geo_point)
+"""
+
+def setup_hospital_geo():
+    conn = get_mysql_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'hospital' AND column_name = 'geo_point'
+    """)
+    if cursor.fetchone()[0]:
+        print("✅ hospital.geo_point already exists")
+    else:
+        cursor.execute(ADD_GEO_COLUMN)
+        conn.commit()
+        print("✅ Added hospital.geo_point with a spatial index")
+
+    cursor.close()
+    conn.close()
+
+if __name__ == "__main__":
+    setup_hospital_geo()
@@ -0,0 +1,48 @@
+# Adds slot capacities and the slot_holds table used by slot_reservations.py
+from db_config import get_mysql_connection
+
+ADD_CAPACITY = """
+ALTER TABLE appointment_slots
+    ADD COLUMN capacity INT NOT NULL DEFAULT 1,
+    ADD COLUMN booked_count INT NOT NULL DEFAULT 0
+"""
+
+# Slots already marked as booked start out full
+SYNC_BOOKED_COUNT = "UPDATE appointment_slots SET booked_count = capacity WHERE is_booked = TRUE"
+
+CREATE_SLOT_HOLDS = """
+CREATE TABLE IF NOT EXISTS slot_holds (
+    hold_id CHAR(32) PRIMARY KEY,
+    slot_id INT NOT NULL,
+    patient_id INT NOT NULL,
+    expires_at DATETIME(3) NOT NULL,
+    INDEX idx_slot_holds_slot_expiry (slot_id, expires_at),
+    INDEX idx_slot_holds_expiry (expires_at)
+)
+"""
+
+def setup_slot_reservations():
+    conn = get_mysql_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'appointment_slots' AND column_name = 'booked_count'
+    """)
+    if cursor.fetchone()[0]:
+        print("✅ appointment_slots.capacity / booked_count already exist")
+    else:
+        cursor.execute(ADD_CAPACITY)
+        cursor.execute(SYNC_BOOKED_COUNT)
+        conn.commit()
+        print("✅ Added appointment_slots.capacity and booked_count")
+
+    cursor.execute(CREATE_SLOT_HOLDS)
+    conn.commit()
+    print("✅ slot_holds table ready")
+
+    cursor.close()
+    conn.close()
+
+if __name__ == "__main__":
+    setup_slot_reservations()
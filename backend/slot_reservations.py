@@ -0,0 +1,286 @@
+import os
+import secrets
+import threading
+import time
+
+from doctor_lookup import invalidate_doctor_slots
+
+# ============================================
+# SLOT RESERVATIONS
+# ============================================
+# A booking takes a place in its slot with one conditional UPDATE on the
+# slot's primary key. The row lock is held only for that statement, so a
+# flash crowd on one doctor's slots queues on single-row updates instead of
+# SELECT ... FOR UPDATE round trips, and a slot can never be handed out
+# more often than it has places.
+#
+# With the columns and table from setup_slot_reservations.py:
+#   - each slot has a capacity and a booked_count; is_booked turns TRUE
+#     when it is full, so searches stop offering it
+#   - a client can hold a place for SLOT_HOLD_SECONDS (slot_holds row plus
+#     a counted place) and confirm it when booking. Expired holds are
+#     reclaimed when a slot looks full, and by sweep_expired_holds() every
+#     HOLD_SWEEP_INTERVAL, since a full slot is hidden from searches and
+#     may never be tried again
+# Without them every slot has a single place tracked by is_booked, and
+# holds are unavailable.
+
+SLOT_HOLD_SECONDS = int(os.environ.get("MEDIQUERY_SLOT_HOLD_SECONDS", 120))
+
+# A full slot is checked for expired holds at most this often per process,
+# so a crowd retrying a full slot does not turn into a crowd of reclaims
+HOLD_RECLAIM_INTERVAL = float(os.environ.get("MEDIQUERY_HOLD_RECLAIM_SECONDS", 1))
+
+# Seconds between sweeps for all expired holds (0 disables the sweep)
+HOLD_SWEEP_INTERVAL = float(os.environ.get("MEDIQUERY_HOLD_SWEEP_SECONDS", 30))
+
+RESERVATION_SCHEMA_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM information_schema.columns
+     WHERE table_schema = DATABASE() AND table_name = 'appointment_slots'
+     AND column_name = 'booked_count') AS capacity,
+    (SELECT COUNT(*) FROM information_schema.tables
+     WHERE table_schema = DATABASE() AND table_name = 'slot_holds') AS holds
+"""
+
+# MySQL applies SET assignments left to right, so is_booked sees the new count
+RESERVE_SLOT = """
+UPDATE appointment_slots
+SET booked_count = booked_count + 1, is_booked = booked_count >= capacity
+WHERE slot_id = %s AND booked_count < capacity AND slot_date >= CURDATE()
+"""
+
+RELEASE_SLOT = """
+UPDATE appointment_slots
+SET booked_count = booked_count - %s, is_booked = booked_count >= capacity
+WHERE slot_id = %s AND booked_count >= %s
+"""
+
+RESERVE_SINGLE_SLOT = """
+UPDATE appointment_slots SET is_booked = TRUE
+WHERE slot_id = %s AND is_booked = FALSE AND slot_date >= CURDATE()
+"""
+
+RELEASE_SINGLE_SLOT = "UPDATE appointment_slots SET is_booked = FALSE WHERE slot_id = %s"
+
+INSERT_HOLD = """
+INSERT INTO slot_holds (hold_id, slot_id, patient_id, expires_at)
+VALUES (%s, %s, %s, NOW(3) + INTERVAL %s SECOND)
+"""
+
+# Confirming consumes the hold; its place is already counted in booked_count
+CONFIRM_HOLD = """
+DELETE FROM slot_holds
+WHERE hold_id = %s AND slot_id = %s AND patient_id = %s AND expires_at > NOW(3)
+"""
+
+LOCK_HOLD = """
+SELECT h.slot_id, s.doctor_id FROM slot_holds h
+JOIN appointment_slots s ON s.slot_id = h.slot_id
+WHERE h.hold_id = %s AND h.patient_id = %s
+FOR UPDATE OF h
+"""
+
+# Holds being confirmed or reclaimed elsewhere are skipped, not waited on
+LOCK_EXPIRED_HOLDS = """
+SELECT h.hold_id, h.slot_id, s.doctor_id FROM slot_holds h
+JOIN appointment_slots s ON s.slot_id = h.slot_id
+WHERE h.expires_at <= NOW(3){slot_filter}
+ORDER BY h.expires_at
+LIMIT %s
+FOR UPDATE OF h SKIP LOCKED
+"""
+
+DELETE_HOLDS = "DELETE FROM slot_holds WHERE hold_id IN ({placeholders})"
+
+class HoldsUnavailable(Exception):
+    pass
+
+_schema = None
+_schema_lock = threading.Lock()
+_reclaimed_at = {}
+_swept_at = float("-inf")
+_sweep_lock = threading.Lock()
+_sweeper = None
+
+def reservation_schema(conn):
+    """{"capacity": bool, "holds": bool} for this database, detected once per process"""
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                cursor = conn.cursor()
+                cursor.execute(RESERVATION_SCHEMA_QUERY)
+                capacity, holds = cursor.fetchone()
+                cursor.close()
+                _schema = {"capacity": bool(capacity), "holds": bool(capacity and holds)}
+                print(f"🎟️ Slot reservations: capacity={_schema['capacity']} holds={_schema['holds']}")
+    return _schema
+
+def _execute(conn, query, params):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+def reclaim_due(slot_id):
+    """True at most once per HOLD_RECLAIM_INTERVAL for a slot"""
+    now = time.monotonic()
+    if now - _reclaimed_at.get(slot_id, float("-inf")) < HOLD_RECLAIM_INTERVAL:
+        return False
+    if len(_reclaimed_at) > 10000:
+        _reclaimed_at.clear()
+    _reclaimed_at[slot_id] = now
+    return True
+
+def reserve_slot(conn, slot_id):
+    """Take one place in a slot; False when it is full (or in the past)"""
+    schema = reservation_schema(conn)
+    if not schema["capacity"]:
+        reserved = _execute(conn, RESERVE_SINGLE_SLOT, (slot_id,)) == 1
+        conn.commit()
+        return reserved
+
+    reserved = _execute(conn, RESERVE_SLOT, (slot_id,)) == 1
+    conn.commit()
+    # A full slot may only be full of abandoned holds
+    if not reserved and schema["holds"] and reclaim_due(slot_id) and reclaim_expired_holds(conn, slot_id):
+        reserved = _execute(conn, RESERVE_SLOT, (slot_id,)) == 1
+        conn.commit()
+    return reserved
+
+def release_slot(conn, slot_id, count=1):
+    """Give back places taken by reserve_slot (cancellation, failed booking)"""
+    if reservation_schema(conn)["capacity"]:
+        _execute(conn, RELEASE_SLOT, (count, slot_id, count))
+    else:
+        _execute(conn, RELEASE_SINGLE_SLOT, (slot_id,))
+    conn.commit()
+
+def hold_slot(conn, slot_id, patient_id):
+    """Reserve a place for SLOT_HOLD_SECONDS; the hold_id, or None when the slot is full"""
+    if not reservation_schema(conn)["holds"]:
+        raise HoldsUnavailable("Slot holds need setup_slot_reservations.py")
+    if not reserve_slot(conn, slot_id):
+        return None
+
+    hold_id = secrets.token_hex(16)
+    try:
+        _execute(conn, INSERT_HOLD, (hold_id, slot_id, patient_id, SLOT_HOLD_SECONDS))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        release_slot(conn, slot_id)
+        raise
+    return hold_id
+
+def confirm_hold(conn, hold_id, slot_id, patient_id):
+    """Turn a live hold into a booking; False if it expired or does not match"""
+    if not reservation_schema(conn)["holds"]:
+        raise HoldsUnavailable("Slot holds need setup_slot_reservations.py")
+    confirmed = _execute(conn, CONFIRM_HOLD, (hold_id, slot_id, patient_id)) == 1
+    conn.commit()
+    return confirmed
+
+def release_hold(conn, hold_id, patient_id):
+    """Drop a hold before it expires; the slot_id it held, or None"""
+    if not reservation_schema(conn)["holds"]:
+        raise HoldsUnavailable("Slot holds need setup_slot_reservations.py")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(LOCK_HOLD, (hold_id, patient_id))
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        slot_id, doctor_id = row
+        cursor.execute(DELETE_HOLDS.format(placeholders="%s"), (hold_id,))
+        cursor.execute(RELEASE_SLOT, (1, slot_id, 1))
+        conn.commit()
+        invalidate_doctor_slots(doctor_id)
+        return slot_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def reclaim_expired_holds(conn, slot_id=None, limit=100):
+    """Free the places of expired holds (for one slot, or any); how many were freed"""
+    slot_filter = " AND h.slot_id = %s" if slot_id is not None else ""
+    params = (slot_id, limit) if slot_id is not None else (limit,)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(LOCK_EXPIRED_HOLDS.format(slot_filter=slot_filter), params)
+        expired = cursor.fetchall()
+        if not expired:
+            conn.rollback()
+            return 0
+
+        cursor.execute(
+            DELETE_HOLDS.format(placeholders=", ".join(["%s"] * len(expired))),
+            tuple(hold_id for hold_id, _, _ in expired)
+        )
+        freed = {}
+        for _, held_slot_id, _ in expired:
+            freed[held_slot_id] = freed.get(held_slot_id, 0) + 1
+        for held_slot_id, count in freed.items():
+            cursor.execute(RELEASE_SLOT, (count, held_slot_id, count))
+        conn.commit()
+        # The freed places were hidden from cached slot lists
+        for doctor_id in {doctor_id for _, _, doctor_id in expired}:
+            invalidate_doctor_slots(doctor_id)
+        return len(expired)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def sweep_expired_holds(conn, batch_size=100):
+    """
+    Reclaim all expired holds, at most once per HOLD_SWEEP_INTERVAL per
+    process; how many were freed
+    """
+    global _swept_at
+    if not reservation_schema(conn)["holds"]:
+        return 0
+    with _sweep_lock:
+        now = time.monotonic()
+        if now - _swept_at < HOLD_SWEEP_INTERVAL:
+            return 0
+        _swept_at = now
+
+    total = 0
+    while True:
+        freed = reclaim_expired_holds(conn, limit=batch_size)
+        total += freed
+        if freed < batch_size:
+            break
+    if total:
+        print(f"🎟️ Reclaimed {total} expired slot holds")
+    return total
+
+def start_hold_sweeper(connection):
+    """
+    Daemon thread that runs sweep_expired_holds every HOLD_SWEEP_INTERVAL.
+    connection is a context manager factory such as db_config.mysql_connection.
+    """
+    global _sweeper
+    if HOLD_SWEEP_INTERVAL <= 0 or _sweeper is not None:
+        return _sweeper
+
+    def run():
+        while True:
+            time.sleep(HOLD_SWEEP_INTERVAL)
+            try:
+                with connection() as conn:
+                    sweep_expired_holds(conn)
+            except Exception as e:
+                print(f"⚠️ Hold sweep failed: {e}")
+
+    _sweeper = threading.Thread(target=run, name="hold-sweeper", daemon=True)
+    _sweeper.start()
+    return _sweeper
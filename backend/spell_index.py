@@ -0,0 +1,131 @@
+from collections import defaultdict
+
+# ============================================
+# SYMSPELL-STYLE SPELLING CORRECTION
+# ============================================
+# Every vocabulary word is stored under all of its deletion variants (up to
+# max_edit_distance characters removed). A misspelled token is corrected by
+# generating its own deletion variants and looking them up, so a lookup
+# costs the same no matter how large the vocabulary is; edit distance is
+# only computed for the handful of words that share a variant.
+#
+# Like SymSpell's frequency dictionary, a list of known (non-vocabulary)
+# words can be given; those are real words, not typos, and are never
+# corrected. Neither are their inflections: a token is known when removing
+# a common suffix leaves a known or vocabulary word ("fewer" -> "few",
+# "slots" -> "slot"), so word lists need not spell out every form.
+
+# (suffix, replacement) pairs tried when looking for a token's base word
+SUFFIXES = [
+    ("ies", "y"), ("ied", "y"), ("ier", "y"), ("iest", "y"), ("ily", "y"),
+    ("ency", "ent"), ("ancy", "ant"),
+    ("ing", ""), ("ing", "e"), ("ed", ""), ("ed", "e"), ("er", ""), ("er", "e"),
+    ("est", ""), ("est", "e"), ("es", ""), ("s", ""), ("ly", "")
+]
+DOUBLING_SUFFIXES = ("ing", "ed", "er", "est")
+MIN_BASE_LENGTH = 3
+
+def base_forms(token):
+    """Words token could be an inflection of ("stopped" -> "stop", "stopp", "stoppe")"""
+    bases = set()
+    for suffix, replacement in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_BASE_LENGTH:
+            base = token[:-len(suffix)]
+            bases.add(base + replacement)
+            # "stopped" -> "stop", "bigger" -> "big"
+            if suffix in DOUBLING_SUFFIXES and not replacement and len(base) > MIN_BASE_LENGTH and base[-1] == base[-2]:
+                bases.add(base[:-1])
+    return bases
+
+def load_word_list(path):
+    """
+    Lower-cased words from a file with one word per line. Extra columns
+    (SymSpell's "word count" frequency format) and # comments are ignored.
+    """
+    words = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if fields and not fields[0].startswith("#"):
+                words.add(fields[0].lower())
+    return words
+
+def _deletes(word, max_distance):
+    """All strings reachable from word by removing up to max_distance characters"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for variant in frontier:
+            for i in range(len(variant)):
+                next_frontier.add(variant[:i] + variant[i + 1:])
+        next_frontier -= variants
+        variants |= next_frontier
+        frontier = next_frontier
+    return variants
+
+def edit_distance(a, b):
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions)"""
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[len(b)]
+
+class SpellIndex:
+    def __init__(self, words, max_edit_distance=2, known_words=()):
+        self.words = set(words)
+        self.known_words = frozenset(known_words) - self.words
+        self.max_edit_distance = max_edit_distance
+        self.variants = defaultdict(set)
+        for word in self.words:
+            for variant in _deletes(word, max_edit_distance):
+                self.variants[variant].add(word)
+        self.variants = dict(self.variants)
+
+    def is_known(self, token):
+        """
+        True for vocabulary words, known words and their inflections,
+        which need no correction
+        """
+        if token in self.words or token in self.known_words:
+            return True
+        return any(base in self.words or base in self.known_words for base in base_forms(token))
+
+    def lookup(self, token, max_distance=None):
+        """
+        Closest vocabulary word to token as (word, distance), or None if
+        nothing is within max_distance or token is a known word.
+        Ties go to the alphabetically first word.
+        """
+        if token in self.words:
+            return token, 0
+        if self.is_known(token):
+            return None
+
+        if max_distance is None:
+            max_distance = self.max_edit_distance
+        max_distance = min(max_distance, self.max_edit_distance)
+        if max_distance <= 0:
+            return None
+
+        best = None
+        seen = set()
+        for variant in _deletes(token, max_distance):
+            for word in self.variants.get(variant, ()):
+                if word in seen or abs(len(word) - len(token)) > max_distance:
+                    continue
+                seen.add(word)
+                distance = edit_distance(token, word)
+                if distance <= max_distance and (best is None or (distance, word) < best):
+                    best = (distance, word)
+
+        if best is None:
+            return None
+        return best[1], best[0]
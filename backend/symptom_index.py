@@ -0,0 +1,253 @@
+from bisect import bisect_right
+from collections import defaultdict
+import heapq
+import itertools
+import re
+from phrase_matcher import PhraseMatcher
+from spell_index import SpellIndex
+
+# ============================================
+# IN-MEMORY SYMPTOM INDEX
+# ============================================
+# Inverted index over the medical_knowledge collection:
+#   symptom name -> [(disease position, symptom position, weight), ...]
+# Scoring a query only touches the diseases that share at least one
+# symptom with the input instead of walking the whole catalogue.
+#
+# Symptom names, their synonyms and the emergency keywords are compiled
+# into one Aho-Corasick automaton, so multi-word symptoms such as
+# "shortness of breath" match as phrases. Misspelled words are first
+# corrected against the vocabulary of those phrases; symptoms found through
+# a corrected word score a reduced weight. Known English words are never
+# corrected, so "never" does not turn into "fever".
+
+# Slack for float rounding when comparing score upper bounds
+BOUND_EPSILON = 1e-9
+
+def normalize_phrase(text):
+    """Same normalization as nlp.clean_text, joined back into one string"""
+    return " ".join(re.sub(r'[^a-z\s]', '', text.lower()).split())
+
+def as_term_weights(terms):
+    """Accept either {symptom name: weight multiplier} or a plain collection of names"""
+    return terms if isinstance(terms, dict) else dict.fromkeys(terms, 1.0)
+
+class SymptomIndex:
+    def __init__(self, diseases, emergency_keywords=(), max_edit_distance=2,
+                 min_correction_length=5, correction_penalty=0.15,
+                 short_token_length=9, known_words=()):
+        """
+        max_edit_distance: largest spelling correction (0 disables correction)
+        min_correction_length: shorter tokens are never corrected
+        correction_penalty: weight lost per corrected character
+        short_token_length: shorter tokens are corrected by one edit at most
+        known_words: real words that are never corrected
+        """
+        self.diseases = diseases
+        self.min_correction_length = min_correction_length
+        self.short_token_length = short_token_length
+        self.correction_penalty = correction_penalty
+        self.max_weights = []
+        self.postings = defaultdict(list)
+        self.positions = defaultdict(list)
+        self.matcher = PhraseMatcher()
+        phrases = set()
+
+        for disease_pos, disease in enumerate(diseases):
+            self.positions[disease["disease"]].append(disease_pos)
+            total_possible_weight = 0
+            for symptom_pos, symptom in enumerate(disease.get("symptoms", [])):
+                weight = symptom.get("weight", 0.5)
+                total_possible_weight += weight
+                self.postings[symptom["name"]].append((disease_pos, symptom_pos, weight))
+
+                for phrase in [symptom["name"]] + symptom.get("synonyms", []):
+                    key = (normalize_phrase(phrase), symptom["name"])
+                    if key not in phrases:
+                        phrases.add(key)
+                        self.matcher.add(key[0], ("symptom", symptom["name"]))
+            self.max_weights.append(total_possible_weight)
+
+        # Emergency keywords keep their substring semantics ("nosebleeding")
+        for keyword in emergency_keywords:
+            self.matcher.add(normalize_phrase(keyword), ("emergency", keyword), whole_words=False)
+
+        self.matcher.build()
+
+        vocabulary = {word for phrase, _ in phrases for word in phrase.split()}
+        vocabulary.update(word for keyword in emergency_keywords for word in normalize_phrase(keyword).split())
+        self.spelling = SpellIndex(vocabulary, max_edit_distance, known_words) if max_edit_distance > 0 else None
+        self.postings = dict(self.postings)
+        self.positions = dict(self.positions)
+
+        # Confidence contribution of each symptom per disease (weight / max
+        # possible weight), sorted by disease position for top_k, with the
+        # largest contribution kept as the symptom's score upper bound
+        self.contributions = {}
+        self.max_contributions = {}
+        for term, postings in self.postings.items():
+            merged = {}
+            for disease_pos, _, weight in postings:
+                if self.max_weights[disease_pos] > 0:
+                    merged[disease_pos] = merged.get(disease_pos, 0) + weight / self.max_weights[disease_pos]
+            self.contributions[term] = (sorted(merged.items()), merged)
+            self.max_contributions[term] = max(merged.values(), default=0)
+
+    def __len__(self):
+        return len(self.diseases)
+
+    def correct(self, user_words):
+        """
+        Spell-correct tokens that are neither in the symptom vocabulary nor
+        known words. Tokens under short_token_length characters may be one
+        edit away, longer ones up to max_edit_distance.
+        Returns (words, weight multiplier per word).
+        """
+        words = list(user_words)
+        multipliers = [1.0] * len(words)
+        if self.spelling is None:
+            return words, multipliers
+
+        for i, word in enumerate(words):
+            if len(word) < self.min_correction_length or self.spelling.is_known(word):
+                continue
+            correction = self.spelling.lookup(word, 1 if len(word) < self.short_token_length else None)
+            if correction:
+                words[i] = correction[0]
+                multipliers[i] = max(0.0, 1.0 - self.correction_penalty * correction[1])
+        return words, multipliers
+
+    def scan(self, user_words):
+        """
+        One pass over the spell-corrected input.
+        Returns ({symptom name: weight multiplier}, emergency keywords found);
+        the multiplier is below 1.0 when the phrase needed a correction.
+        """
+        words, multipliers = self.correct(user_words)
+        word_starts = list(itertools.accumulate((len(word) + 1 for word in words[:-1]), initial=0))
+
+        terms = {}
+        emergencies = set()
+        for start, end, (kind, value) in self.matcher.find(" ".join(words)):
+            if kind == "symptom":
+                first, last = bisect_right(word_starts, start) - 1, bisect_right(word_starts, end - 1) - 1
+                multiplier = 1.0
+                for word_multiplier in multipliers[first:last + 1]:
+                    multiplier *= word_multiplier
+                # An exact occurrence beats a corrected one
+                terms[value] = max(terms.get(value, 0.0), multiplier)
+            else:
+                emergencies.add(value)
+        return terms, emergencies
+
+    def match(self, terms):
+        """
+        Score the symptom names found by scan() against the index.
+        Returns {disease position: (initial_score, matched_symptoms)} for
+        every disease with at least one matching symptom.
+        """
+        terms = as_term_weights(terms)
+        hits = defaultdict(list)
+        for term, multiplier in terms.items():
+            for disease_pos, symptom_pos, weight in self.postings.get(term, ()):
+                hits[disease_pos].append((symptom_pos, term, weight * multiplier))
+
+        matches = {}
+        for disease_pos, symptom_hits in hits.items():
+            # Keep the knowledge-base symptom order so scores and
+            # matched_symptoms are identical to a full scan
+            symptom_hits.sort()
+            initial_score = 0
+            matched_symptoms = []
+            for _, name, weight in symptom_hits:
+                initial_score += weight
+                matched_symptoms.append(name)
+            matches[disease_pos] = (initial_score, matched_symptoms)
+
+        return matches
+
+    def top_k(self, terms, k):
+        """
+        Best k diseases by initial confidence, using MaxScore pruning.
+        Symptom lists are ordered by upper bound; once k results are held,
+        lists whose combined bound cannot beat the k-th confidence stop
+        producing candidates, and candidates whose bound falls below it
+        are skipped without being scored.
+        Returns [(confidence, disease position, initial_score, matched_symptoms)]
+        in the same order as a full sort by confidence.
+        """
+        terms = as_term_weights(terms)
+        lists = sorted(
+            ((self.max_contributions[t] * m, self.contributions[t], m) for t, m in terms.items() if t in self.contributions),
+            key=lambda x: x[0]
+        )
+        n = len(lists)
+        bounds = list(itertools.accumulate(bound for bound, _, _ in lists))
+        cursors = [0] * n
+        heap = []
+        threshold = 0.0
+        first_essential = 0
+
+        while first_essential < n:
+            # Next disease (in catalogue order) from the essential lists
+            candidate = None
+            for i in range(first_essential, n):
+                postings = lists[i][1][0]
+                if cursors[i] < len(postings) and (candidate is None or postings[cursors[i]][0] < candidate):
+                    candidate = postings[cursors[i]][0]
+            if candidate is None:
+                break
+
+            upper = 0.0
+            for i in range(first_essential, n):
+                postings = lists[i][1][0]
+                if cursors[i] < len(postings) and postings[cursors[i]][0] == candidate:
+                    upper += postings[cursors[i]][1] * lists[i][2]
+                    cursors[i] += 1
+
+            # Add the non-essential lists by lookup, largest bound first
+            pruned = False
+            for i in range(first_essential - 1, -1, -1):
+                if len(heap) == k and upper + bounds[i] < threshold - BOUND_EPSILON:
+                    pruned = True
+                    break
+                upper += lists[i][1][1].get(candidate, 0) * lists[i][2]
+            if pruned or (len(heap) == k and upper < threshold - BOUND_EPSILON):
+                continue
+
+            initial_score, matched_symptoms = self._score(candidate, terms)
+            if initial_score <= 0:
+                continue
+            confidence = min(initial_score / self.max_weights[candidate], 1.0)
+
+            # Candidates arrive in catalogue order, so on equal confidence the
+            # earlier disease wins, same as a stable sort
+            entry = (confidence, -candidate, candidate, initial_score, matched_symptoms)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+            else:
+                continue
+
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while first_essential < n and bounds[first_essential] < threshold - BOUND_EPSILON:
+                    first_essential += 1
+
+        heap.sort(key=lambda e: (-e[0], e[2]))
+        return [(confidence, disease_pos, initial_score, matched_symptoms)
+                for confidence, _, disease_pos, initial_score, matched_symptoms in heap]
+
+    def top_k_batch(self, queries, k):
+        return [self.top_k(terms, k) for terms in queries]
+
+    def _score(self, disease_pos, terms):
+        """Exact initial score of one disease, summed in knowledge-base order"""
+        initial_score = 0
+        matched_symptoms = []
+        for symptom in self.diseases[disease_pos].get("symptoms", []):
+            if symptom["name"] in terms:
+                initial_score += symptom.get("weight", 0.5) * terms[symptom["name"]]
+                matched_symptoms.append(symptom["name"])
+        return initial_score, matched_symptoms
@@ -0,0 +1,139 @@
+from symptom_index import as_term_weights
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only needed for the "numpy" scoring engine
+    np = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+# ============================================
+# VECTORIZED SYMPTOM SCORING ENGINE
+# ============================================
+# Compiles a SymptomIndex into a disease x symptom weight matrix so the
+# initial score of a query (or a whole batch of queries) is a single
+# matrix product. Uses a scipy sparse matrix when scipy is installed,
+# otherwise a dense NumPy array.
+
+class SymptomMatrix:
+    def __init__(self, index):
+        if np is None:
+            raise RuntimeError("numpy is required for the vectorized scoring engine")
+
+        self.index = index
+        self.diseases = index.diseases
+        self.postings = index.postings
+        self.positions = index.positions
+        self.scan = index.scan
+        self.vocabulary = {name: col for col, name in enumerate(index.postings)}
+        self.max_weights = index.max_weights
+        self.max_weight_vector = np.asarray(index.max_weights, dtype=float)
+
+        rows, cols, weights = [], [], []
+        for name, col in self.vocabulary.items():
+            for disease_pos, _, weight in index.postings[name]:
+                rows.append(disease_pos)
+                cols.append(col)
+                weights.append(weight)
+
+        shape = (len(index), len(self.vocabulary))
+        if sparse is not None:
+            # Duplicate (row, col) entries are summed, same as repeated symptoms
+            self.weights = sparse.csr_matrix((weights, (rows, cols)), shape=shape)
+        else:
+            self.weights = np.zeros(shape)
+            np.add.at(self.weights, (rows, cols), weights)
+
+    def __len__(self):
+        return len(self.diseases)
+
+    def query_matrix(self, queries):
+        """One row per query holding the weight multiplier of every symptom found by scan()"""
+        rows, cols, values = [], [], []
+        for row, terms in enumerate(queries):
+            for term, multiplier in as_term_weights(terms).items():
+                if term in self.vocabulary:
+                    rows.append(row)
+                    cols.append(self.vocabulary[term])
+                    values.append(multiplier)
+
+        shape = (len(queries), len(self.vocabulary))
+        if sparse is not None:
+            return sparse.csr_matrix((values, (rows, cols)), shape=shape)
+        matrix = np.zeros(shape)
+        matrix[rows, cols] = values
+        return matrix
+
+    def scores(self, queries):
+        """Initial score of every disease for every query (queries x diseases)"""
+        scores = self.query_matrix(queries) @ self.weights.T
+        return scores.toarray() if sparse is not None else scores
+
+    def confidences(self, queries):
+        """Initial-symptom confidence (score / max possible weight), capped at 1.0"""
+        return self._confidences(self.scores(queries))
+
+    def _confidences(self, scores):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            confidence = np.where(self.max_weight_vector > 0, scores / self.max_weight_vector, 0.0)
+        return np.minimum(confidence, 1.0)
+
+    def top_k(self, terms, k):
+        return self.top_k_batch([terms], k)[0]
+
+    def top_k_batch(self, queries, k):
+        """
+        Best k diseases per query from one matrix product, same result
+        shape and ordering as SymptomIndex.top_k
+        """
+        scores = self.scores(queries)
+        confidence = self._confidences(scores)
+        results = []
+        for row, terms in enumerate(queries):
+            candidates = np.flatnonzero(scores[row] > 0)
+            candidate_confidence = confidence[row, candidates]
+            if len(candidates) > k:
+                # Keep everything tied with the k-th best so ties break by catalogue order
+                kth = np.partition(candidate_confidence, len(candidates) - k)[len(candidates) - k]
+                keep = candidate_confidence >= kth
+                candidates, candidate_confidence = candidates[keep], candidate_confidence[keep]
+            order = np.lexsort((candidates, -candidate_confidence))[:k]
+
+            top = []
+            for disease_pos in candidates[order]:
+                disease_pos = int(disease_pos)
+                matched_symptoms = [
+                    symptom["name"]
+                    for symptom in self.diseases[disease_pos].get("symptoms", [])
+                    if symptom["name"] in terms
+                ]
+                top.append((float(confidence[row, disease_pos]), disease_pos,
+                            float(scores[row, disease_pos]), matched_symptoms))
+            results.append(top)
+        return results
+
+    def match(self, terms):
+        return self.match_batch([terms])[0]
+
+    def match_batch(self, queries):
+        """
+        Same result shape as SymptomIndex.match, one dict per query:
+        {disease position: (initial_score, matched_symptoms)}
+        """
+        scores = self.scores(queries)
+        results = []
+        for row, terms in enumerate(queries):
+            matches = {}
+            for disease_pos in np.flatnonzero(scores[row]):
+                disease_pos = int(disease_pos)
+                matched_symptoms = [
+                    symptom["name"]
+                    for symptom in self.diseases[disease_pos].get("symptoms", [])
+                    if symptom["name"] in terms
+                ]
+                matches[disease_pos] = (float(scores[row, disease_pos]), matched_symptoms)
+            results.append(matches)
+        return results
@@ -0,0 +1,53 @@
+# Spelling correction regression tests against the real medical knowledge base
+#
+#   cd backend && python -m pytest test_symptom_index.py
+import os
+
+import pytest
+
+from complete_medical_knowledge_setup import medical_knowledge_data
+from spell_index import load_word_list
+from symptom_index import SymptomIndex
+
+COMMON_WORDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "common_words.txt")
+
+@pytest.fixture(scope="module")
+def index():
+    return SymptomIndex(medical_knowledge_data, known_words=load_word_list(COMMON_WORDS))
+
+@pytest.mark.parametrize("text", [
+    "i never had this before",
+    "it started right after lunch",
+    "found it hard to sleep",
+    "my eight year old might have it",
+    "rough and tough week",
+    "a wound from a fall",
+    "i cheat on my diet",
+    "turning over in the mourning",
+    "weigh myself every day",
+    "loud noise outside",
+    "i have fewer now",
+    "fewer headaches now",
+    "spelling is hard",
+    "no slots left",
+    "he loses his keys",
+    "lifting weights",
+    "the frequency changed",
+])
+def test_common_words_are_not_corrected(index, text):
+    terms, _ = index.scan(text.split())
+    assert terms == {}
+
+@pytest.mark.parametrize("word, symptom", [
+    ("hedache", "headache"),
+    ("nausia", "nausea"),
+    ("vomitting", "vomiting"),
+])
+def test_misspelled_symptoms_are_corrected(index, word, symptom):
+    terms, _ = index.scan([word])
+    assert symptom in terms
+    assert 0 < terms[symptom] < 1.0
+
+def test_exact_symptoms_keep_full_weight(index):
+    terms, _ = index.scan("headache and nausea".split())
+    assert terms == {"headache": 1.0, "nausea": 1.0}
@@ -306,6 +306,10 @@ function displayFollowUpQuestions(disease, questions) {
     return html;
 }
 
+// Idempotency-Key per slot, reused until the booking settles so retries and
+// repeat clicks cannot book twice
+const bookingKeys = {};
+
 // Book appointment slot
 async function bookSlot(slotId, doctorId) {
     // Always prompt for patient details on every booking
@@ -318,10 +322,17 @@ async function bookSlot(slotId, doctorId) {
     let patientName = prompt("Enter your full name:");
     if (!patientName) patientName = "Guest Patient";
     
+    if (!bookingKeys[slotId]) {
+        bookingKeys[slotId] = crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random()}`;
+    }
+
     try {
         const response = await fetch("http://127.0.0.1:5000/book-appointment", {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
+            headers: {
+                "Content-Type": "application/json",
+                "Idempotency-Key": bookingKeys[slotId]
+            },
             body: JSON.stringify({
                 slot_id: slotId,
                 patient_id: parseInt(patientId),
@@ -330,6 +341,8 @@ async function bookSlot(slotId, doctorId) {
         });
         
         const data = await response.json();
+        // Settled; a network error above keeps the key for the retry
+        delete bookingKeys[slotId];
         
         if (data.success) {
             alert(`✅ Appointment Booked!
@@ -378,7 +391,10 @@ async function submitFollowUp(disease, numQuestions) {
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({
                 original_symptoms: originalSymptoms,
-                follow_up_answers: answers
+                follow_up_answers: answers,
+                latitude: userLocation?.lat,
+                longitude: userLocation?.lng,
+                max_distance_km: parseInt(document.getElementById('distanceRange').value)
             })
         });
         